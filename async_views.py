@@ -0,0 +1,169 @@
+import asyncio
+
+import es_config
+from . import es_transport, response_cache, json_backend, metrics, views
+from .json_backend import JsonResponse
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Async varianter av views som bara gör anrop till ES (kräver ASGI server, t.ex. uvicorn eller daphne)
+
+# En worker kan då ha många anrop till ES igång samtidigt istället för att blockeras under varje anrop,
+# och oberoende anrop i samma request (t.ex. endpoints i batch/) skickas samtidigt.
+# Används istället för views i urls.py när es_config.async_views = True. Anrop till ES görs via httpx om den finns installerad.
+
+async def esQueryAsync(request, query, formatFunc = None, apiUrl = None, returnRaw = False, metadataFunc = None, blockingFormat = False):
+	# Samma som views.esQuery men väntar på svaret från ES utan att blockera
+	# blockingFormat: formatFunc kan anropa ES (t.ex. koordinater för socknar som saknas i gazetteer) och körs då i en tråd
+	esPath = '/'+es_config.index_name+(apiUrl if apiUrl else '/legend/_search')
+
+	# Remove queryObject if it is empty (Elasticsearch 7 seems to not like empty query object)
+	if 'query' in query and not query['query']:
+		query.pop('query', None)
+
+	headers = {'Accept': 'application/json', 'content-type': 'application/json'}
+
+	# Tidsmätning för varje fas, se metrics.py
+	timings = {}
+
+	logger.debug("url, query %s %s", esPath, query)
+	with metrics.timer(timings, 'es_request'):
+		esResponse = await es_transport.esGetAsync(esPath,
+												   data=json_backend.dumps(query),
+												   headers=headers)
+
+	# Utan formatFunc skickar vi ES svaret vidare utan att parsa det (bara metadata läggs till)
+	if not formatFunc and not returnRaw and not metadataFunc:
+		with metrics.timer(timings, 'encode'):
+			httpResponse = views.rawJsonResponse(request, query, esResponse.content)
+
+		if httpResponse is not None:
+			httpResponse.esStatusCode = esResponse.status_code
+
+			metrics.emit(request, timings)
+
+			return httpResponse
+
+	with metrics.timer(timings, 'decode'):
+		responseData = json_backend.loads(esResponse.content)
+	logger.debug("response status_code %s %s ", esResponse.status_code, responseData)
+
+	if 'took' in responseData:
+		timings['es_took'] = responseData['took']/1000.0
+
+	# Fel från ES för returnRaw (endpoints i batch/) levereras som i views.esMultiQuery istället för att formateras
+	if returnRaw and (esResponse.status_code != 200 or 'error' in responseData):
+		metrics.emit(request, timings)
+
+		return views.createErrorOutputData(responseData.get('error', responseData), esResponse.status_code if esResponse.status_code != 200 else 500)
+
+	with metrics.timer(timings, 'format'):
+		if blockingFormat:
+			outputData = await asyncio.get_running_loop().run_in_executor(None, views.createOutputData, request, query, formatFunc, responseData, metadataFunc)
+		else:
+			outputData = views.createOutputData(request, query, formatFunc, responseData, metadataFunc)
+
+	if returnRaw:
+		metrics.emit(request, timings)
+
+		return outputData
+	else:
+		with metrics.timer(timings, 'encode'):
+			jsonResponse = JsonResponse(outputData)
+		jsonResponse['Access-Control-Allow-Origin'] = '*'
+		jsonResponse.esStatusCode = esResponse.status_code
+
+		metrics.emit(request, timings)
+
+		return jsonResponse
+
+async def loadDimensionCatalog():
+	# Dimension katalogen laddas (om den saknas eller är för gammal) i en tråd så att event loop inte blockeras
+	await asyncio.get_running_loop().run_in_executor(None, views.dimensionCatalog.get)
+
+async def queryView(request, createFunc):
+	# View som bygger upp query via createFunc (t.ex. views.createTypesQuery) och anropar ES
+	query, jsonFormat = createFunc(request, views.createQuery(request))
+
+	return await esQueryAsync(request, query, jsonFormat)
+
+@response_cache.cachedResponse
+async def getTypes(request):
+	return await queryView(request, views.createTypesQuery)
+
+@response_cache.cachedResponse
+async def getCategories(request):
+	return await queryView(request, views.createCategoriesQuery)
+
+@response_cache.cachedResponse
+async def getCollectionYears(request):
+	return await queryView(request, views.createCollectionYearsQuery)
+
+@response_cache.cachedResponse
+async def getBirthYears(request):
+	await loadDimensionCatalog()
+
+	return await queryView(request, views.createBirthYearsQuery)
+
+@response_cache.cachedResponse
+async def getGender(request):
+	await loadDimensionCatalog()
+
+	return await queryView(request, views.createGenderQuery)
+
+@response_cache.cachedResponse
+async def getSocken(request):
+	# socken/ lista, med paging via after= (se views.usePagedAggregation), stream=true hanteras av views.getSocken
+	if views.isStreaming(request):
+		return await asyncio.get_running_loop().run_in_executor(None, views.getSocken.__wrapped__, request)
+
+	query, jsonFormat = views.createSockenQuery(request, views.createQuery(request))
+
+	pagingError = views.pagingParamError(request)
+
+	if pagingError is not None:
+		return pagingError
+
+	jsonFormat, metadataFunc = views.usePagedAggregation(request, query, ['data', 'data'], jsonFormat)
+
+	return await esQueryAsync(request, query, jsonFormat, metadataFunc=metadataFunc, blockingFormat=True)
+
+@response_cache.cachedResponse
+async def getBatch(request):
+	# Som views.getBatch men varje endpoint skickas som ett eget anrop till ES, alla anrop görs samtidigt
+	endpoints = request.GET['endpoints'].split(',') if 'endpoints' in request.GET else []
+
+	unknownEndpoints = [endpoint for endpoint in endpoints if endpoint not in views.batchEndpoints]
+
+	if len(endpoints) == 0 or len(unknownEndpoints) > 0:
+		jsonResponse = JsonResponse({
+			'error': 'Unknown or missing endpoints: '+','.join(unknownEndpoints),
+			'endpoints': sorted(views.batchEndpoints.keys())
+		}, status=400)
+		jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+		return jsonResponse
+
+	await loadDimensionCatalog()
+
+	# createQuery körs bara en gång, alla endpoints använder samma query object
+	queryObject = views.createQuery(request)
+
+	queries = [views.batchEndpoints[endpoint](request, queryObject) for endpoint in endpoints]
+
+	# socken kan hämta koordinater från ES (se views.resolveLocations), formateras därför i en tråd
+	results = await asyncio.gather(*[esQueryAsync(request, query, jsonFormat, None, True, blockingFormat=endpoint == 'socken') for endpoint, (query, jsonFormat) in zip(endpoints, queries)])
+
+	response = dict(zip(endpoints, results))
+
+	jsonResponse = JsonResponse(response)
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	# Som views.getBatch, svar där ES har levererat fel för någon endpoint cachas inte (se response_cache.esSucceeded)
+	errors = [response[endpoint] for endpoint in endpoints if 'error' in response[endpoint]]
+
+	if len(errors) > 0:
+		jsonResponse.esStatusCode = errors[0]['status']
+
+	return jsonResponse
@@ -0,0 +1,47 @@
+# Jämför json modulen med orjson (se json_backend.py) på inspelade svar från Elasticsearch
+
+# Spela in svar från ES för t.ex. socken/ och documents/ genom att köra samma query som endpoint skickar
+# (lägg till showQuery=true till url:et för att se query:en) och spara svaret till fil:
+#   curl -s -H 'content-type: application/json' -d @socken_query.json https://[host]/[index]/legend/_search > socken.json
+
+# Kör sedan:
+#   python benchmarks/json_backend_benchmark.py socken.json documents.json
+
+# För varje fil mäts decode (som esQuery gör med svaret från ES) och encode (som JsonResponse gör med svaret till klienten)
+
+import json, sys, timeit
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+def benchmark(name, data, number):
+	decoded = json.loads(data)
+
+	backends = [
+		('json', json.loads, lambda obj: json.dumps(obj).encode('utf-8'))
+	]
+
+	if orjson is not None:
+		backends.append(('orjson', orjson.loads, orjson.dumps))
+
+	print('%s (%d bytes)' % (name, len(data)))
+
+	for backendName, loads, dumps in backends:
+		decodeTime = timeit.timeit(lambda: loads(data), number=number)/number
+		encodeTime = timeit.timeit(lambda: dumps(decoded), number=number)/number
+
+		print('  %-8s decode %8.2f ms  encode %8.2f ms' % (backendName, decodeTime*1000, encodeTime*1000))
+
+if __name__ == '__main__':
+	if len(sys.argv) < 2:
+		print('Usage: python json_backend_benchmark.py [inspelade svar (json filer)] ...')
+		sys.exit(1)
+
+	if orjson is None:
+		print('orjson is not installed, only measuring json')
+
+	for fileName in sys.argv[1:]:
+		with open(fileName, 'rb') as f:
+			benchmark(fileName, f.read(), 20)
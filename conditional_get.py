@@ -0,0 +1,136 @@
+import asyncio, functools, hashlib
+from django.http import HttpResponseNotModified
+
+import es_config
+from . import index_generation, response_cache
+
+# ETag och Cache-Control för alla views (läggs på alla urls i urls.py)
+
+# ETag byggs av endpoint och params (samma kanoniska form som nyckeln i response cachen) och indexets generation
+# (se index_generation.py), så att den kan räknas ut utan att anropa ES. Anrop med If-None-Match som matchar
+# besvaras med 304 direkt. ETag ändras när indexet ändras, Cache-Control sätts per endpoint klass.
+
+# Tills indexets generation har hämtats efter omstart levereras svaren utan ETag.
+
+# Inställningar som läses från es_config (alla är valfria):
+# conditional_get: False stänger av ETag och 304 svar, Cache-Control sätts fortfarande (default True)
+# cache_control: dict med Cache-Control per endpoint klass, ersätter värden i defaultCacheControl
+
+defaultCacheControl = {
+	'aggregations': 'public, max-age=300',
+	'documents': 'public, max-age=60',
+	'totals': 'public, max-age=3600',
+	'no_store': 'no-store'
+}
+
+# Endpoint klass per url name (name i urls.py), andra endpoints räknas som aggregations
+endpointClasses = {
+	'getDocuments': 'documents',
+	'getDocument': 'documents',
+	'getSimilar': 'documents',
+	'getTexts': 'documents',
+	'getSockenTotal': 'totals',
+	'getCollectionYearsTotal': 'totals',
+	'getBirthYearsTotal': 'totals',
+	'getGenderTotal': 'totals',
+	'getDimensions': 'totals',
+	'getDocumentsExport': 'no_store',
+	'getRandomDocument': 'no_store',
+	'getMetrics': 'no_store',
+	'getCacheStats': 'no_store'
+}
+
+def isEnabled():
+	return getattr(es_config, 'conditional_get', True)
+
+def endpointClass(name):
+	return endpointClasses.get(name, 'aggregations')
+
+def getCacheControl(endpointClass):
+	cacheControl = getattr(es_config, 'cache_control', {})
+
+	return cacheControl[endpointClass] if endpointClass in cacheControl else defaultCacheControl[endpointClass]
+
+def createEtag(request, generation):
+	canonical = request.path+'?'+'&'.join(key+'='+value for key, value in response_cache.canonicalParams(request))
+
+	return '"'+generation+'-'+hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16]+'"'
+
+def etagMatches(request, etag):
+	# Jämför etag med If-None-Match (lista av etags eller *), W/ prefix ignoreras (t.ex. från GZipMiddleware)
+	ifNoneMatch = request.META.get('HTTP_IF_NONE_MATCH')
+
+	if not ifNoneMatch:
+		return False
+
+	if ifNoneMatch.strip() == '*':
+		return True
+
+	etag = etag[2:] if etag.startswith('W/') else etag
+
+	for value in ifNoneMatch.split(','):
+		value = value.strip()
+
+		if (value[2:] if value.startswith('W/') else value) == etag:
+			return True
+
+	return False
+
+def conditionalResponse(view, endpointClass = 'aggregations'):
+	# Lägger till ETag och Cache-Control för view, levererar 304 om If-None-Match matchar
+	# Fungerar både för vanliga views och async views (se async_views.py)
+	def requestEtag(request):
+		if not isEnabled() or endpointClass == 'no_store' or request.method not in ('GET', 'HEAD'):
+			return None
+
+		generation = index_generation.get()
+
+		return createEtag(request, generation) if generation is not None else None
+
+	def notModifiedResponse(etag):
+		response = HttpResponseNotModified()
+		response['ETag'] = etag
+		response['Cache-Control'] = getCacheControl(endpointClass)
+		response['Access-Control-Allow-Origin'] = '*'
+
+		return response
+
+	def addHeaders(response, etag):
+		# Svar som bygger på fel från ES levereras med status 200 men ska varken få ETag eller cachas (se response_cache.esSucceeded)
+		if not response_cache.esSucceeded(response):
+			response['Cache-Control'] = getCacheControl('no_store')
+
+			return response
+
+		# Views som redan har satt ETag (t.ex. snapshots) behåller sin ETag, streaming svar får ingen ETag
+		# eftersom de kan avbrytas efter att status 200 har skickats
+		if etag is not None and response.status_code == 200 and not response.streaming and not response.has_header('ETag'):
+			response['ETag'] = etag
+
+		if (response.status_code in (200, 304) or endpointClass == 'no_store') and not response.has_header('Cache-Control'):
+			response['Cache-Control'] = getCacheControl(endpointClass)
+
+		return response
+
+	if asyncio.iscoroutinefunction(view):
+		@functools.wraps(view)
+		async def asyncWrapper(request, *args, **kwargs):
+			etag = requestEtag(request)
+
+			if etag is not None and etagMatches(request, etag):
+				return notModifiedResponse(etag)
+
+			return addHeaders(await view(request, *args, **kwargs), etag)
+
+		return asyncWrapper
+
+	@functools.wraps(view)
+	def wrapper(request, *args, **kwargs):
+		etag = requestEtag(request)
+
+		if etag is not None and etagMatches(request, etag):
+			return notModifiedResponse(etag)
+
+		return addHeaders(view(request, *args, **kwargs), etag)
+
+	return wrapper
@@ -0,0 +1,66 @@
+import threading, time
+
+import es_config
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Katalog över dimensioner som bara ändras när indexet byggs om (person roller, materialtyper, kategorier, landskap och län)
+
+# Katalogen laddas från ES via en loader function första gången den används och ligger sedan i minnet tills
+# den blir äldre än es_config.dimension_catalog_ttl sekunder (default 3600) eller invalidate() anropas.
+# Bara en tråd laddar katalogen åt gången, andra trådar får den gamla katalogen under tiden (eller väntar om den saknas).
+
+
+class DimensionCatalog:
+	def __init__(self, loader):
+		self.loader = loader
+		self.data = None
+		self.loadedAt = None
+
+		self._lock = threading.Lock()
+
+	def isExpired(self):
+		return self.data is None or time.time()-self.loadedAt > getattr(es_config, 'dimension_catalog_ttl', 3600)
+
+	def get(self):
+		# Levererar katalogen, laddar den från ES om den saknas eller är för gammal
+		data = self.data
+
+		if data is not None and not self.isExpired():
+			return data
+
+		# Medan en tråd laddar om katalogen levererar övriga trådar den gamla, bara när katalogen saknas väntar de på laddningen
+		if data is not None:
+			if not self._lock.acquire(blocking=False):
+				return data
+		else:
+			self._lock.acquire()
+
+		try:
+			if self.isExpired():
+				start = time.perf_counter()
+
+				try:
+					data = self.loader()
+				except Exception:
+					if self.data is None:
+						raise
+
+					# Den gamla katalogen används tills laddningen lyckas
+					logger.exception('dimension catalog could not be loaded')
+
+					return self.data
+
+				self.loadedAt = time.time()
+				self.data = data
+
+				logger.info('dimension catalog loaded in %.2f s', time.perf_counter()-start)
+
+			return self.data
+		finally:
+			self._lock.release()
+
+	def invalidate(self):
+		# Katalogen laddas om nästa gång den används (t.ex. efter att indexet har byggts om), tills dess levereras den gamla
+		self.loadedAt = 0
@@ -2,4 +2,71 @@ host = 'Elasticsearch host namn'
 index_name = 'Elasticsearch index namn'
 user = 'användarnamn'
 password = 'lösenord'
-cert_file = 'path till cert.pem fil'
\ No newline at end of file
+cert_file = 'path till cert.pem fil'
+
+# Connection pool mot Elasticsearch (valfria, se es_transport.py)
+pool_connections = 10
+pool_maxsize = 10
+#pool_sizes = {'Elasticsearch host namn': 20}
+pool_block = False
+max_retries = 0
+timeout = 30
+# Antal trådar för anrop till ES som körs parallellt (es_transport.runParallel)
+parallel_workers = 8
+
+# Response cache för aggregations endpoints (valfria, se response_cache.py)
+# 'local' = in-process LRU cache, 'django' = Djangos cache framework, None = ingen cache
+response_cache_backend = 'local'
+response_cache_ttl = 300
+response_cache_max_bytes = 64*1024*1024
+response_cache_alias = 'default'
+
+# JSON backend, 'orjson' (används om den finns installerad) eller 'json' (se json_backend.py)
+json_backend = 'orjson'
+
+# Gränser för latency histogram i sekunder (valfri, se metrics.py)
+#metrics_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Antal buckets per sida för composite aggregation (paging via after=, valfri)
+composite_page_size = 1000
+
+# Export av dokument via export/documents/ (valfria)
+export_batch_size = 1000
+export_keep_alive = '1m'
+
+# Fält som används för stabil sortering vid paging via cursor= (valfri)
+cursor_tiebreaker = '_id'
+
+# Lokala index för autocomplete (valfria, se local_index.py)
+local_index_enabled = True
+local_index_refresh = 3600
+local_index_retry = 60
+
+# Hur länge dimension katalogen (person roller, materialtyper, kategorier, landskap, län) ligger i minnet i sekunder (valfri)
+dimension_catalog_ttl = 3600
+
+# Async views för endpoints som bara anropar ES, kräver ASGI server (valfri, se async_views.py)
+async_views = False
+
+# Samordning av identiska anrop till ES som görs samtidigt (valfri, se single_flight.py)
+single_flight = True
+
+# Snapshots för total_by_type endpoints (valfria, se snapshots.py)
+snapshot_enabled = True
+snapshot_dir = '/var/cache/sagenkarta_es_api/snapshots'
+snapshot_refresh = 300
+snapshot_retry = 60
+snapshot_build_timeout = 600
+
+# ETag och Cache-Control (valfria, se conditional_get.py och index_generation.py)
+conditional_get = True
+index_generation_refresh = 60
+#cache_control = {'aggregations': 'public, max-age=300', 'documents': 'public, max-age=60', 'totals': 'public, max-age=3600'}
+
+# Koordinater för socknar som saknas i gazetteer (valfria, se views.lookupLocations)
+location_lookup_ttl = 3600
+location_lookup_max = 1000
+location_lookup_refresh = 300
+
+# Antal objekt som formateras åt gången för stream=true (valfri, se views.esStreamingQuery)
+stream_batch_size = 1000
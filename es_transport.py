@@ -0,0 +1,216 @@
+import asyncio, os, threading, time, weakref
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+# httpx används för anrop från async views (se async_views.py), utan httpx körs anropen via sessionen i en tråd
+try:
+	import httpx
+except ImportError:
+	httpx = None
+
+import es_config
+from . import single_flight
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Delad transport för alla anrop till Elasticsearch
+
+# Istället för en ny requests.get (och därmed ny TCP+TLS uppkoppling) per anrop använder vi en
+# requests.Session per process med connection pool och keep-alive. Sessionen skapas lazy och
+# på nytt om processen har forkats (gunicorn workers ärver annars parent processens sockets).
+
+# Inställningar som läses från es_config (alla är valfria):
+# pool_connections: antal hosts som har en egen connection pool (default 10)
+# pool_maxsize: antal öppna uppkopplingar per host (default 10)
+# pool_sizes: dict med pool_maxsize per host, t.ex. {'es1.example.com:9200': 20}
+# pool_block: vänta på ledig uppkoppling istället för att öppna en extra (default False)
+# max_retries: antal försök vid misslyckad uppkoppling (default 0)
+# timeout: timeout i sekunder för anrop till ES (default None, ingen timeout)
+# parallel_workers: antal trådar för anrop som körs parallellt via runParallel (default 8)
+# single_flight: samordning av identiska anrop, se single_flight.py
+
+_session = None
+_sessionPid = None
+_sessionLock = threading.Lock()
+
+def _createAdapter(maxsize):
+	return HTTPAdapter(
+		pool_connections=getattr(es_config, 'pool_connections', 10),
+		pool_maxsize=maxsize,
+		pool_block=getattr(es_config, 'pool_block', False),
+		max_retries=getattr(es_config, 'max_retries', 0)
+	)
+
+def _createSession():
+	session = requests.Session()
+
+	# Samma beteende som tidigare requests.get(..., verify=False)
+	session.verify = False
+	session.headers.update({
+		'Connection': 'keep-alive'
+	})
+
+	# Inloggning via session.auth och inte i url, annars matchar url inte adaptrarna för pool_sizes nedan
+	if getAuth() is not None:
+		session.auth = HTTPBasicAuth(*getAuth())
+
+	defaultAdapter = _createAdapter(getattr(es_config, 'pool_maxsize', 10))
+	session.mount('http://', defaultAdapter)
+	session.mount('https://', defaultAdapter)
+
+	# Egen pool storlek för specifika hosts, requests väljer adapter med längsta matchande prefix
+	poolSizes = getattr(es_config, 'pool_sizes', {})
+	for host in poolSizes:
+		hostAdapter = _createAdapter(poolSizes[host])
+		session.mount('http://'+host, hostAdapter)
+		session.mount('https://'+host, hostAdapter)
+
+	return session
+
+def getSession():
+	# Levererar sessionen för nuvarande process, skapar den om den inte finns
+	global _session, _sessionPid
+
+	pid = os.getpid()
+
+	if _session is None or _sessionPid != pid:
+		with _sessionLock:
+			if _session is None or _sessionPid != pid:
+				_session = _createSession()
+				_sessionPid = pid
+
+	return _session
+
+_executor = None
+_executorPid = None
+_executorLock = threading.Lock()
+_workerState = threading.local()
+
+def _initWorker():
+	_workerState.isWorker = True
+
+def getExecutor():
+	# Delad ThreadPoolExecutor för nuvarande process, skapas på nytt om processen har forkats (som sessionen)
+	global _executor, _executorPid
+
+	pid = os.getpid()
+
+	if _executor is None or _executorPid != pid:
+		with _executorLock:
+			if _executor is None or _executorPid != pid:
+				_executor = ThreadPoolExecutor(max_workers=getattr(es_config, 'parallel_workers', 8), thread_name_prefix='es_parallel', initializer=_initWorker)
+				_executorPid = pid
+
+	return _executor
+
+def runParallel(calls, timeout=None):
+	# Kör oberoende anrop (functioner utan argument, t.ex. lambda: esQuery(...)) parallellt och levererar resultaten i samma ordning
+	# timeout: max antal sekunder för varje anrop, räknat från när anropet startar (default es_config.timeout),
+	# concurrent.futures.TimeoutError om den överskrids
+	# Om ett anrop misslyckas avbryts de som inte har startat, de som redan körs får bli klara innan felet skickas vidare
+
+	# Anrop från en tråd i executorn körs direkt, annars kan en full executor vänta på sig själv
+	if getattr(_workerState, 'isWorker', False) or len(calls) < 2:
+		return [call() for call in calls]
+
+	if timeout is None:
+		timeout = getattr(es_config, 'timeout', None)
+
+	starts = [None]*len(calls)
+	started = [threading.Event() for call in calls]
+
+	def timedCall(index):
+		starts[index] = time.monotonic()
+		started[index].set()
+
+		return calls[index]()
+
+	futures = [getExecutor().submit(timedCall, index) for index in range(len(calls))]
+
+	try:
+		results = []
+
+		for index, future in enumerate(futures):
+			if timeout is None:
+				results.append(future.result())
+			else:
+				# Anrop som väntar på en ledig tråd räknas från när de startar
+				started[index].wait()
+
+				results.append(future.result(timeout=max(starts[index]+timeout-time.monotonic(), 0)))
+
+		return results
+	except BaseException:
+		for future in futures:
+			future.cancel()
+
+		wait(futures)
+
+		raise
+
+def getAuth():
+	# Användarnamn och lösenord från es_config, None om inloggning inte används
+	return (es_config.user, es_config.password) if hasattr(es_config, 'user') else None
+
+def getUrl(path):
+	# Bygger upp url till ES från es_config, path börjar med / (t.ex. /index_name/legend/_search)
+	# Inloggning skickas via getAuth (session.auth) och ingår inte i url
+	return es_config.protocol+es_config.host+path
+
+def esRequest(method, path, data=None, headers=None, stream=False):
+	# Skickar anrop till ES via den delade sessionen och levererar requests.Response
+	# stream=True: svaret läses inte in direkt utan kan läsas via response.raw (uppkopplingen släpps när svaret stängs)
+	call = lambda: getSession().request(method,
+										getUrl(path),
+										data=data,
+										headers=headers,
+										stream=stream,
+										timeout=getattr(es_config, 'timeout', None))
+
+	# Identiska sökningar som görs samtidigt delar på ett anrop till ES (se single_flight.py), inte för stream där svaret bara kan läsas en gång
+	if method == 'GET' and not stream:
+		return single_flight.run(single_flight.requestKey(method, path, data), call)
+
+	return call()
+
+def esGet(path, data=None, headers=None, stream=False):
+	return esRequest('GET', path, data, headers, stream)
+
+# En httpx.AsyncClient per event loop (en klient kan inte delas mellan event loops)
+_asyncClients = weakref.WeakKeyDictionary()
+
+def getAsyncClient():
+	loop = asyncio.get_running_loop()
+
+	if loop not in _asyncClients:
+		maxsize = getattr(es_config, 'pool_maxsize', 10)
+
+		_asyncClients[loop] = httpx.AsyncClient(
+			verify=False,
+			auth=getAuth(),
+			timeout=getattr(es_config, 'timeout', None),
+			limits=httpx.Limits(max_connections=maxsize if getattr(es_config, 'pool_block', False) else None, max_keepalive_connections=maxsize)
+		)
+
+	return _asyncClients[loop]
+
+async def esRequestAsync(method, path, data=None, headers=None):
+	# Som esRequest men för async views, levererar svar med status_code och content (httpx.Response eller requests.Response)
+	if httpx is None:
+		return await asyncio.get_running_loop().run_in_executor(None, lambda: esRequest(method, path, data, headers))
+
+	call = lambda: getAsyncClient().request(method,
+											getUrl(path),
+											content=data,
+											headers=headers)
+
+	if method == 'GET':
+		return await single_flight.runAsync(single_flight.requestKey(method, path, data), call)
+
+	return await call()
+
+async def esGetAsync(path, data=None, headers=None):
+	return await esRequestAsync('GET', path, data, headers)
@@ -8,8 +8,15 @@ try:
 except ImportError:
 	_geohash = None
 
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+import functools
+
 __version__ = "0.8.5"
-__all__ = ['encode','decode','decode_exactly','bbox', 'neighbors', 'expand']
+__all__ = ['encode','decode','decode_exactly','bbox', 'neighbors', 'expand', 'decode_cached', 'decode_many', 'encode_many']
 
 _base32 = '0123456789bcdefghjkmnpqrstuvwxyz'
 _base32_map = {}
@@ -464,3 +471,160 @@ def expand_uint64(ui64, precision=50):
 		ranges.append((a,b))
 	
 	return ranges
+
+
+# Bulk decode/encode of many hashcodes, e.g. one location per bucket in an aggregation.
+
+# _decode_table[parity][base32 index] = (lat bits, lon bits) of one character,
+# even characters carry 2 lat bits and 3 lon bits, odd characters 3 lat bits and 2 lon bits
+_decode_table = (
+	tuple((((t>>2)&2) + ((t>>1)&1), ((t>>2)&4) + ((t>>1)&2) + (t&1)) for t in range(32)),
+	tuple((((t>>2)&4) + ((t>>1)&2) + (t&1), ((t>>2)&2) + ((t>>1)&1)) for t in range(32))
+)
+
+def _decode_center(lat, lon, lat_length, lon_length):
+	# center of the cell, same value as decode() returns
+	latitude = (2*lat+1)*90.0/(1<<lat_length) - 90.0
+	longitude = (2*lon+1)*180.0/(1<<lon_length) - 180.0
+	return latitude,longitude
+
+def _decode_table_c2i(hashcode):
+	lat = lon = 0
+	lat_length = lon_length = 0
+	parity = 0
+	for i in hashcode:
+		lat_bits, lon_bits = _decode_table[parity][_base32_map[i]]
+		if parity==0:
+			lat = (lat<<2) + lat_bits
+			lon = (lon<<3) + lon_bits
+			lat_length+=2
+			lon_length+=3
+		else:
+			lat = (lat<<3) + lat_bits
+			lon = (lon<<2) + lon_bits
+			lat_length+=3
+			lon_length+=2
+		
+		parity = 1-parity
+	
+	return (lat,lon,lat_length,lon_length)
+
+@functools.lru_cache(maxsize=65536)
+def decode_cached(hashcode):
+	'''
+	decode a hashcode and get center coordinate, memoized
+	'''
+	if _geohash:
+		return decode(hashcode)
+	
+	return _decode_center(*_decode_table_c2i(hashcode))
+
+def _decode_many_numpy(hashcodes):
+	ret = [None]*len(hashcodes)
+	
+	char_map = numpy.zeros(256, dtype=numpy.int64)
+	for i in range(len(_base32)):
+		char_map[ord(_base32[i])] = i
+	
+	lat_table = numpy.array([[bits[0] for bits in table] for table in _decode_table], dtype=numpy.int64)
+	lon_table = numpy.array([[bits[1] for bits in table] for table in _decode_table], dtype=numpy.int64)
+	
+	# hashcodes of the same length are decoded together, column by column
+	lengths = {}
+	for index, hashcode in enumerate(hashcodes):
+		lengths.setdefault(len(hashcode), []).append(index)
+	
+	for length, indexes in lengths.items():
+		if length == 0:
+			continue
+		
+		chars = numpy.frombuffer(''.join([hashcodes[index] for index in indexes]).encode('ascii'), dtype=numpy.uint8)
+		codes = char_map[chars].reshape(len(indexes), length)
+		
+		lat = numpy.zeros(len(indexes), dtype=numpy.int64)
+		lon = numpy.zeros(len(indexes), dtype=numpy.int64)
+		lat_length = lon_length = 0
+		for column in range(length):
+			parity = column%2
+			lat = (lat<<(2+parity)) + lat_table[parity][codes[:,column]]
+			lon = (lon<<(3-parity)) + lon_table[parity][codes[:,column]]
+			lat_length += 2+parity
+			lon_length += 3-parity
+		
+		latitudes = (2*lat+1)*90.0/float(1<<lat_length) - 90.0
+		longitudes = (2*lon+1)*180.0/float(1<<lon_length) - 180.0
+		
+		for index, latitude, longitude in zip(indexes, latitudes.tolist(), longitudes.tolist()):
+			ret[index] = (latitude, longitude)
+	
+	return ret
+
+def decode_many(hashcodes):
+	'''
+	decode a list of hashcodes, returns a list of center coordinates in the same order
+	'''
+	hashcodes = list(hashcodes)
+	
+	if numpy is not None and not _geohash and len(hashcodes) > 0 and max(len(hashcode) for hashcode in hashcodes) <= 12:
+		ret = _decode_many_numpy(hashcodes)
+		
+		# empty hashcodes are left to decode() as before
+		for index, hashcode in enumerate(hashcodes):
+			if ret[index] is None:
+				ret[index] = decode(hashcode)
+		
+		return ret
+	
+	return [decode_cached(hashcode) for hashcode in hashcodes]
+
+def _encode_many_numpy(latitudes, longitudes, precision):
+	latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+	longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+	
+	if numpy.any(latitudes >= 90.0) or numpy.any(latitudes < -90.0):
+		raise Exception("invalid latitude.")
+	outside = numpy.nonzero((longitudes < -180.0) | (longitudes >= 180.0))[0]
+	if len(outside) > 0:
+		longitudes = longitudes.copy()
+		for i in outside:
+			longitude = float(longitudes[i])
+			while longitude < -180.0:
+				longitude += 360.0
+			while longitude >= 180.0:
+				longitude -= 360.0
+			longitudes[i] = longitude
+	
+	xprecision=precision+1
+	lat_length = lon_length = int(xprecision*5/2)
+	if xprecision%2==1:
+		lon_length+=1
+	
+	# same truncation as encode(), floor of the scaled value offset by half the range
+	a = numpy.floor(latitudes/90.0*float(1<<(lat_length-1))).astype(numpy.int64) + (1<<(lat_length-1))
+	b = numpy.floor(longitudes/180.0*float(1<<(lon_length-1))).astype(numpy.int64) + (1<<(lon_length-1))
+	if lat_length < lon_length:
+		a, b = b, a
+	
+	boost = numpy.array((0,1,4,5,16,17,20,21), dtype=numpy.int64)
+	codes = numpy.zeros((len(latitudes), xprecision), dtype=numpy.int64)
+	for i in range(xprecision):
+		codes[:,xprecision-1-i] = (boost[a&7]+(boost[b&3]<<1))&0x1F
+		t = a>>3
+		a = b>>2
+		b = t
+	
+	chars = numpy.frombuffer(_base32.encode('ascii'), dtype=numpy.uint8)[codes[:,:precision]]
+	data = chars.astype(numpy.uint8).tobytes().decode('ascii')
+	
+	return [data[i*precision:(i+1)*precision] for i in range(len(latitudes))]
+
+def encode_many(coordinates, precision=12):
+	'''
+	encode a list of (latitude, longitude), returns a list of hashcodes in the same order
+	'''
+	coordinates = list(coordinates)
+	
+	if numpy is not None and not _geohash and len(coordinates) > 0 and precision <= 12:
+		return _encode_many_numpy([c[0] for c in coordinates], [c[1] for c in coordinates], precision)
+	
+	return [encode(latitude, longitude, precision) for latitude, longitude in coordinates]
@@ -0,0 +1,97 @@
+import hashlib, os, threading, time
+
+import es_config
+from . import es_transport, json_backend
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Generation av indexet: ändras när indexet byggs om (ny uuid) eller när dokument läggs till, uppdateras eller tas bort
+
+# Hämtas från ES (_stats) i en bakgrundstråd (en per process, startas första gången get() anropas) med jämna mellanrum.
+# Används i ETag (conditional_get.py), i nyckeln för response cachen och för snapshots (snapshots.py).
+
+# Inställningar som läses från es_config (alla är valfria):
+# index_generation_refresh: sekunder mellan kontroller av indexets generation (default 60)
+
+def fetchGeneration():
+	# Hämtar generation direkt från ES, byggs av uuid, antal dokument och antal index/delete operationer
+	# för alla index bakom es_config.index_name (kan vara ett alias)
+	response = es_transport.esGet('/'+es_config.index_name+'/_stats/docs,indexing',
+								  headers={'Accept': 'application/json'})
+
+	if response.status_code != 200:
+		raise Exception('index generation could not be fetched, status code '+str(response.status_code))
+
+	indices = json_backend.loads(response.content)['indices']
+
+	parts = []
+
+	for name in sorted(indices):
+		primaries = indices[name]['primaries']
+
+		parts.append(':'.join([
+			indices[name].get('uuid', name),
+			str(primaries['docs']['count']),
+			str(primaries['indexing']['index_total']),
+			str(primaries['indexing']['delete_total'])
+		]))
+
+	return hashlib.sha1(','.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+_generation = None
+_listeners = []
+_thread = None
+_threadPid = None
+_lock = threading.Lock()
+
+def get():
+	# Levererar senast hämtade generation, None om den inte har hämtats än
+	_start()
+
+	return _generation
+
+def onChange(listener):
+	# listener (function utan argument) anropas när generationen har ändrats, t.ex. dimensionCatalog.invalidate
+	_listeners.append(listener)
+
+def _update():
+	global _generation
+
+	generation = fetchGeneration()
+
+	if generation != _generation:
+		previous = _generation
+		_generation = generation
+
+		if previous is not None:
+			logger.info('index generation changed from %s to %s', previous, generation)
+
+			for listener in _listeners:
+				try:
+					listener()
+				except Exception:
+					logger.exception('index generation listener failed')
+
+def _run():
+	while True:
+		try:
+			_update()
+		except Exception:
+			logger.exception('index generation could not be fetched')
+
+		time.sleep(getattr(es_config, 'index_generation_refresh', 60))
+
+def _start():
+	# Startar bakgrundstråden om den inte finns i nuvarande process (trådar följer inte med vid fork)
+	global _thread, _threadPid
+
+	pid = os.getpid()
+
+	if _thread is None or _threadPid != pid:
+		with _lock:
+			if _thread is None or _threadPid != pid:
+				_thread = threading.Thread(target=_run, name='index_generation', daemon=True)
+				_threadPid = pid
+				_thread.start()
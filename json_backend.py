@@ -0,0 +1,103 @@
+import json
+from django.http import HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+
+import es_config
+
+# JSON encoder/decoder för svar från ES och svar från API:et
+
+# Använder orjson om den finns installerad (mycket snabbare för stora svar, t.ex. 10k personer eller socken),
+# annars json modulen. es_config.json_backend = 'json' tvingar json modulen även om orjson finns.
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+# ijson används för att parsa stora svar från ES inkrementellt (se iterateItems)
+try:
+	import ijson
+except ImportError:
+	ijson = None
+
+def useOrjson():
+	return orjson is not None and getattr(es_config, 'json_backend', 'orjson') == 'orjson'
+
+def loads(data):
+	# data kan vara str eller bytes (t.ex. esResponse.content)
+	if useOrjson():
+		return orjson.loads(data)
+
+	return json.loads(data)
+
+def dumps(data):
+	# Levererar bytes (utf-8)
+	if useOrjson():
+		return orjson.dumps(data)
+
+	return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+class JsonResponse(HttpResponse):
+	# Samma som django.http.JsonResponse men serialiserar data via dumps ovan
+	def __init__(self, data, **kwargs):
+		kwargs.setdefault('content_type', 'application/json')
+
+		super().__init__(content=dumps(data), **kwargs)
+
+def _getPrefix(data, prefix):
+	# Hämtar värde via ijson prefix (t.ex. 'hits.total') från redan parsad data
+	for key in prefix.split('.'):
+		if not isinstance(data, dict) or key not in data:
+			return None
+
+		data = data[key]
+
+	return data
+
+def iterateItems(fileObj, itemPrefix, values):
+	# Parsar json från fileObj inkrementellt och levererar objekten i itemPrefix en i taget
+	# itemPrefix är ijson prefix för en lista, t.ex. 'hits.hits.item' eller 'aggregations.data.data.buckets.item'
+
+	# values: dict med prefix som nycklar (t.ex. { 'took': None, 'hits.total': None }), värden för dessa prefix läggs i dict
+	# när de har parsats, prefix som kommer före itemPrefix i svaret (som took och hits.total från ES) finns när första objektet levereras
+
+	# Utan ijson parsas hela svaret på en gång
+	if ijson is None:
+		data = loads(fileObj.read())
+
+		for prefix in values:
+			values[prefix] = _getPrefix(data, prefix)
+
+		items = _getPrefix(data, itemPrefix[:-len('.item')])
+
+		for item in items if items else []:
+			yield item
+
+		return
+
+	builder = None
+	builderPrefix = None
+
+	for prefix, event, value in ijson.parse(fileObj, use_float=True):
+		if builder is not None:
+			builder.event(event, value)
+
+			if prefix == builderPrefix and event in ('end_map', 'end_array'):
+				if builderPrefix == itemPrefix:
+					yield builder.value
+				else:
+					values[builderPrefix] = builder.value
+
+				builder = None
+		elif prefix == itemPrefix or prefix in values:
+			if event in ('start_map', 'start_array'):
+				builder = ijson.ObjectBuilder()
+				builder.event(event, value)
+				builderPrefix = prefix
+			elif event != 'map_key':
+				if prefix == itemPrefix:
+					yield value
+				else:
+					values[prefix] = value
+
@@ -0,0 +1,153 @@
+import bisect, os, threading, time
+
+import es_config
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Lokala index i minnet för autocomplete och uppslag som annars kräver en aggregation i ES per anrop
+
+# Ett LocalIndex laddas från ES via en loader function i en bakgrundstråd (en per process, startas första gången
+# indexet används) och laddas om med jämna mellanrum. Tills indexet har laddats första gången levererar get() None
+# och anroparen frågar ES som tidigare (cold start).
+
+# Inställningar som läses från es_config (alla är valfria):
+# local_index_enabled: False stänger av lokala index, alla anrop går till ES (default True)
+# local_index_refresh: sekunder mellan omladdningar av indexen (default 3600)
+# local_index_retry: sekunder innan nytt försök om laddningen misslyckades (default 60)
+
+def isEnabled():
+	return getattr(es_config, 'local_index_enabled', True)
+
+def normalize(value):
+	# Gemener och enkla mellanslag, används för både indexerade texter och söksträngar
+	return ' '.join(value.lower().split())
+
+
+class LocalIndex:
+	def __init__(self, name, loader):
+		self.name = name
+		self.loader = loader
+		self.data = None
+		self.loadedAt = None
+
+		self._thread = None
+		self._threadPid = None
+		self._lock = threading.Lock()
+		self._refreshEvent = threading.Event()
+		self._refreshRequestedAt = 0
+
+	def get(self):
+		# Levererar senast laddade data, None om indexet inte har laddats än
+		if not isEnabled():
+			return None
+
+		self._start()
+
+		return self.data
+
+	def refresh(self, minInterval = 0):
+		# Ber bakgrundstråden att ladda om indexet direkt (t.ex. när ett id saknas i indexet)
+		# minInterval: ingen omladdning om indexet har laddats eller omladdning begärts för mindre än minInterval sekunder sedan
+		if not isEnabled():
+			return
+
+		now = time.time()
+
+		if now-max(self.loadedAt or 0, self._refreshRequestedAt) < minInterval:
+			return
+
+		self._refreshRequestedAt = now
+
+		self._start()
+		self._refreshEvent.set()
+
+	def load(self):
+		# Laddar indexet via loader, data byts ut i ett steg så att pågående anrop ser antingen gamla eller nya data
+		start = time.perf_counter()
+
+		data = self.loader()
+
+		self.data = data
+		self.loadedAt = time.time()
+
+		logger.info('local index %s loaded in %.2f s', self.name, time.perf_counter()-start)
+
+	def _start(self):
+		# Startar bakgrundstråden om den inte finns i nuvarande process (trådar följer inte med vid fork)
+		pid = os.getpid()
+
+		if self._thread is None or self._threadPid != pid:
+			with self._lock:
+				if self._thread is None or self._threadPid != pid:
+					self._thread = threading.Thread(target=self._run, name='local_index_'+self.name, daemon=True)
+					self._threadPid = pid
+					self._thread.start()
+
+	def _run(self):
+		while True:
+			try:
+				self.load()
+				interval = getattr(es_config, 'local_index_refresh', 3600)
+			except Exception:
+				logger.exception('local index %s could not be loaded', self.name)
+				interval = getattr(es_config, 'local_index_retry', 60)
+
+			self._refreshEvent.wait(interval)
+			self._refreshEvent.clear()
+
+
+class SubstringIndex:
+	# Sorterad lista av alla suffix av alla ord i texterna, prefix och infix sökning görs med bisect
+
+	# Ett ord i söksträngen är alltid början av ett suffix av något ord i en träffande text,
+	# kandidaterna hämtas via det längsta ordet i söksträngen och kontrolleras sedan mot hela texten
+	def __init__(self, texts):
+		self.texts = [normalize(text) for text in texts]
+
+		entries = set()
+
+		for position, text in enumerate(self.texts):
+			for token in set(text.split()):
+				for start in range(len(token)):
+					entries.add((token[start:], position))
+
+		entries = sorted(entries)
+
+		self.suffixes = [entry[0] for entry in entries]
+		self.positions = [entry[1] for entry in entries]
+
+	def search(self, value):
+		# Levererar positioner (index i texts) för alla texter som innehåller value, sorterade
+		value = normalize(value)
+
+		if not value:
+			return list(range(len(self.texts)))
+
+		token = max(value.split(), key=len)
+
+		start = bisect.bisect_left(self.suffixes, token)
+		end = bisect.bisect_left(self.suffixes, token+'\U0010ffff', start)
+
+		return sorted(set(position for position in self.positions[start:end] if value in self.texts[position]))
+
+	def prefixSearch(self, value):
+		# Levererar positioner för alla texter som börjar med value
+		value = normalize(value)
+
+		return [position for position in self.search(value) if self.texts[position].startswith(value)]
+
+
+class TermDictionary:
+	# Sorterad lista av termer med antal, prefix sökning görs med bisect
+	def __init__(self, terms):
+		# terms: lista av dict med term (t.ex. { term, doc_count, terms })
+		self.items = sorted(terms, key=lambda item: item['term'])
+		self.terms = [item['term'] for item in self.items]
+
+	def prefixSearch(self, value):
+		# Levererar alla termer som börjar med value
+		start = bisect.bisect_left(self.terms, value)
+		end = bisect.bisect_left(self.terms, value+'\U0010ffff', start)
+
+		return self.items[start:end]
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+# views importeras så att views med snapshots.snapshotResponse registreras i snapshots.builders
+from ... import snapshots, views
+
+# Bygger snapshots för total_by_type endpoints (se snapshots.py), körs t.ex. efter omindexering
+# så att första anropet efter omstart inte behöver vänta på aggregationerna
+
+class Command(BaseCommand):
+	help = 'Build snapshots for the total_by_type endpoints for the current version of the index'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--force', action='store_true', help='Rebuild snapshots that already exist for the current version')
+
+	def handle(self, *args, **options):
+		version = snapshots.build(force=options['force'])
+
+		for name in sorted(snapshots.builders):
+			self.stdout.write(name+': '+snapshots.getPath(name, version))
@@ -0,0 +1,128 @@
+import bisect, functools, json, threading, time
+from contextlib import contextmanager
+
+import es_config
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Tidsmätning av faser i esQuery (create_query, es_request, es_took, decode, format, encode) per view
+
+# Varje anrop loggas till loggern sagenkarta_es_api.metrics (info nivå) som json, t.ex.
+# {"view": "getPersons", "timings": {"es_request": 0.412, "es_took": 0.380, "decode": 0.051, "format": 0.022, "encode": 0.018}}
+# och läggs till latency histogram som levereras i Prometheus text format via metrics/ endpoint.
+
+# Histogrammen finns per process, med flera gunicorn workers behöver Prometheus hämta från varje worker
+# (eller så får man räkna med att varje scrape träffar en slumpmässig worker).
+
+# es_config.metrics_buckets: gränser för histogram buckets i sekunder (valfri)
+defaultBuckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+metricName = 'sagenkarta_es_api_phase_seconds'
+
+
+class Histogram:
+	def __init__(self, buckets):
+		self.buckets = buckets
+		self.counts = [0]*len(buckets)
+		self.sum = 0.0
+		self.count = 0
+
+	def observe(self, value):
+		index = bisect.bisect_left(self.buckets, value)
+
+		if index < len(self.buckets):
+			self.counts[index] += 1
+
+		self.sum += value
+		self.count += 1
+
+
+_histograms = {}
+_lock = threading.Lock()
+
+def getBuckets():
+	return tuple(sorted(getattr(es_config, 'metrics_buckets', defaultBuckets)))
+
+def viewName(request):
+	# Namn på view som anropade esQuery, från url:en (name i urls.py)
+	if request is not None and getattr(request, 'resolver_match', None) is not None:
+		return request.resolver_match.url_name or request.resolver_match.view_name
+
+	return 'internal'
+
+def observe(view, phase, seconds):
+	with _lock:
+		key = (view, phase)
+
+		if key not in _histograms:
+			_histograms[key] = Histogram(getBuckets())
+
+		_histograms[key].observe(seconds)
+
+@contextmanager
+def timer(timings, phase):
+	# Mäter tiden för with blocket och lägger den i timings[phase]
+	start = time.perf_counter()
+
+	try:
+		yield
+	finally:
+		timings[phase] = timings.get(phase, 0)+time.perf_counter()-start
+
+def emit(request, timings):
+	# Lägger till mätningar från ett anrop till histogrammen och loggar dem
+	view = viewName(request)
+
+	for phase in timings:
+		observe(view, phase, timings[phase])
+
+	if logger.isEnabledFor(logging.INFO):
+		logger.info(json.dumps({
+			'view': view,
+			'timings': timings
+		}), extra={
+			'view': view,
+			'timings': timings
+		})
+
+def timedPhase(phase):
+	# Decorator för functioner som tar request som första argument (t.ex. createQuery)
+	def decorator(func):
+		@functools.wraps(func)
+		def wrapper(request, *args, **kwargs):
+			timings = {}
+
+			with timer(timings, phase):
+				ret = func(request, *args, **kwargs)
+
+			emit(request, timings)
+
+			return ret
+
+		return wrapper
+
+	return decorator
+
+def render():
+	# Levererar alla histogram i Prometheus text format
+	lines = [
+		'# HELP '+metricName+' Time spent in each phase of Elasticsearch calls, per view.',
+		'# TYPE '+metricName+' histogram'
+	]
+
+	with _lock:
+		for (view, phase) in sorted(_histograms.keys()):
+			histogram = _histograms[(view, phase)]
+			labels = 'view="'+view+'",phase="'+phase+'"'
+
+			cumulative = 0
+			for bucket, count in zip(histogram.buckets, histogram.counts):
+				cumulative += count
+				lines.append(metricName+'_bucket{'+labels+',le="'+repr(float(bucket))+'"} '+str(cumulative))
+
+			lines.append(metricName+'_bucket{'+labels+',le="+Inf"} '+str(histogram.count))
+			lines.append(metricName+'_sum{'+labels+'} '+repr(histogram.sum))
+			lines.append(metricName+'_count{'+labels+'} '+str(histogram.count))
+
+	return '\n'.join(lines)+'\n'
@@ -0,0 +1,291 @@
+import asyncio, functools, hashlib, threading, time
+from collections import OrderedDict
+from django.http import HttpResponse
+
+import es_config
+from . import index_generation
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Cache för färdiga svar från aggregations endpoints
+
+# Nyckeln byggs av endpoint (request.path, inkluderar t.ex. socken id) och en kanonisk form av request.GET
+# så att t.ex. ?type=tryckt,arkiv&category=L och ?category=L&type=arkiv,tryckt delar samma cache post.
+# Nyckeln innehåller även indexets generation (se index_generation.py).
+
+# Inställningar som läses från es_config (alla är valfria):
+# response_cache_backend: 'local' (in-process LRU), 'django' (Djangos cache framework), en backend klass eller None för att stänga av cachen (default 'local')
+# response_cache_ttl: hur länge ett svar ligger i cachen i sekunder (default 300)
+# response_cache_max_bytes: max storlek på local cachen i bytes (default 64 MB)
+# response_cache_alias: vilken cache i settings.CACHES som används av 'django' backend (default 'default')
+
+# Params som är kommaseparerade listor där ordningen inte påverkar query:en
+unorderedListParams = [
+	'transcriptionstatus',
+	'category',
+	'categorytypes',
+	'type',
+	'documents',
+	'socken_id',
+	'socken',
+	'landskap',
+	'person',
+	'person_exact',
+	'person_id',
+	'gender',
+	'birth_years',
+	'terms',
+	'title_terms'
+]
+
+# Params vars default värde ger samma query som om param saknas
+defaultParams = {
+	'search_raw': 'false',
+	'search_exclude_title': 'false',
+	'only_geography': 'false',
+	'only_categories': 'false'
+}
+
+def canonicalParams(request):
+	# Levererar request.GET som sorterad lista av (key, value), listor sorterade och default värden borttagna
+	# Bara sista värdet för varje param ingår, det är det värdet som views läser (request.GET[key])
+	params = []
+
+	for key in sorted(request.GET.keys()):
+		value = request.GET[key]
+
+		# Samma jämförelse som i createQuery (skiftlägeskänslig), t.ex. search_raw=FALSE ger en annan query än default
+		if key in defaultParams and value == defaultParams[key]:
+			continue
+
+		if key in unorderedListParams:
+			value = ','.join(sorted(value.split(',')))
+
+		params.append((key, value))
+
+	return params
+
+def cacheKey(request):
+	canonical = request.path+'?'+'&'.join(key+'='+value for key, value in canonicalParams(request))
+
+	# Indexets generation ingår i nyckeln så att svar från före en ändring av indexet inte levereras efter ändringen
+	generation = index_generation.get()
+
+	if generation is not None:
+		canonical += '#'+generation
+
+	return 'sagenkarta_es_api:response:'+hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class CacheStats:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+		self.stores = 0
+		self.evictions = 0
+
+	def add(self, name, value = 1):
+		with self.lock:
+			setattr(self, name, getattr(self, name)+value)
+
+	def asDict(self):
+		with self.lock:
+			lookups = self.hits+self.misses
+
+			return {
+				'hits': self.hits,
+				'misses': self.misses,
+				'hit_rate': float(self.hits)/lookups if lookups > 0 else 0,
+				'stores': self.stores,
+				'evictions': self.evictions
+			}
+
+
+class LocalMemoryBackend:
+	# In-process LRU cache, begränsad av total storlek i bytes
+	def __init__(self, maxBytes):
+		self.maxBytes = maxBytes
+		self.entries = OrderedDict()
+		self.size = 0
+		self.lock = threading.Lock()
+
+	def _remove(self, key):
+		expires, value, size = self.entries.pop(key)
+		self.size -= size
+
+	def get(self, key):
+		with self.lock:
+			if key not in self.entries:
+				return None
+
+			expires, value, size = self.entries[key]
+
+			if expires < time.time():
+				self._remove(key)
+				return None
+
+			self.entries.move_to_end(key)
+
+			return value
+
+	def set(self, key, value, size, ttl):
+		# Levererar antal poster som togs bort för att få plats
+		evicted = 0
+
+		if size > self.maxBytes:
+			return evicted
+
+		with self.lock:
+			if key in self.entries:
+				self._remove(key)
+
+			while self.size+size > self.maxBytes:
+				self._remove(next(iter(self.entries)))
+				evicted += 1
+
+			self.entries[key] = (time.time()+ttl, value, size)
+			self.size += size
+
+		return evicted
+
+	def info(self):
+		with self.lock:
+			return {
+				'entries': len(self.entries),
+				'bytes': self.size,
+				'max_bytes': self.maxBytes
+			}
+
+
+class DjangoCacheBackend:
+	# Använder Djangos cache framework (t.ex. memcached eller redis) så att flera processer delar cachen
+	def __init__(self, alias):
+		from django.core.cache import caches
+		self.cache = caches[alias]
+		self.alias = alias
+
+	def get(self, key):
+		return self.cache.get(key)
+
+	def set(self, key, value, size, ttl):
+		self.cache.set(key, value, ttl)
+		return 0
+
+	def info(self):
+		return {
+			'alias': self.alias
+		}
+
+
+_backend = None
+_backendLock = threading.Lock()
+
+stats = CacheStats()
+
+def getBackend():
+	global _backend
+
+	if _backend is None:
+		with _backendLock:
+			if _backend is None:
+				backend = getattr(es_config, 'response_cache_backend', 'local')
+
+				if backend == 'local':
+					_backend = LocalMemoryBackend(getattr(es_config, 'response_cache_max_bytes', 64*1024*1024))
+				elif backend == 'django':
+					_backend = DjangoCacheBackend(getattr(es_config, 'response_cache_alias', 'default'))
+				else:
+					_backend = backend(es_config)
+
+	return _backend
+
+def isEnabled():
+	return getattr(es_config, 'response_cache_backend', 'local') is not None
+
+def getStats():
+	ret = stats.asDict()
+
+	if isEnabled():
+		ret['backend'] = getBackend().info()
+
+		# Storlek på poster som finns i cachen (local backend räknar bort poster som har tagits bort eller gått ut)
+		if 'bytes' in ret['backend']:
+			ret['stored_bytes'] = ret['backend']['bytes']
+
+	return ret
+
+def _getCachedResponse(key, backend):
+	cached = backend.get(key)
+
+	if cached is None:
+		stats.add('misses')
+
+		return None
+
+	stats.add('hits')
+
+	content, headers = cached
+
+	response = HttpResponse(content)
+	for header, value in headers:
+		response[header] = value
+
+	return response
+
+def esSucceeded(response):
+	# Views sätter response.esStatusCode (status från ES, se views.esQuery), svar som bygger på fel från ES
+	# (t.ex. get_document för ett id som saknas) levereras med status 200 men cachas inte och får ingen ETag
+	return 200 <= getattr(response, 'esStatusCode', 200) < 300
+
+def _storeResponse(key, backend, response):
+	if response.status_code == 200 and not response.streaming and esSucceeded(response):
+		size = len(key)+len(response.content)
+
+		evicted = backend.set(key, (response.content, list(response.items())), size, getattr(es_config, 'response_cache_ttl', 300))
+
+		stats.add('stores')
+		stats.add('evictions', evicted)
+
+def cachedResponse(view):
+	# Decorator för views, levererar cachat svar om det finns, annars anropas view och svaret (status 200) läggs i cachen
+	# Fungerar både för vanliga views och async views (se async_views.py)
+	if asyncio.iscoroutinefunction(view):
+		@functools.wraps(view)
+		async def asyncWrapper(request, *args, **kwargs):
+			if not isEnabled() or request.method not in ('GET', 'HEAD'):
+				return await view(request, *args, **kwargs)
+
+			key = cacheKey(request)
+			backend = getBackend()
+
+			response = _getCachedResponse(key, backend)
+
+			if response is None:
+				response = await view(request, *args, **kwargs)
+
+				_storeResponse(key, backend, response)
+
+			return response
+
+		return asyncWrapper
+
+	@functools.wraps(view)
+	def wrapper(request, *args, **kwargs):
+		if not isEnabled() or request.method not in ('GET', 'HEAD'):
+			return view(request, *args, **kwargs)
+
+		key = cacheKey(request)
+		backend = getBackend()
+
+		response = _getCachedResponse(key, backend)
+
+		if response is None:
+			response = view(request, *args, **kwargs)
+
+			_storeResponse(key, backend, response)
+
+		return response
+
+	return wrapper
@@ -0,0 +1,110 @@
+import asyncio, hashlib, os, threading, weakref
+
+import es_config
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Samordning av identiska anrop till ES som görs samtidigt (single flight)
+
+# När många hämtar samma sida samtidigt (t.ex. kartan som anropar socken/?mark_metadata=... och types/)
+# skickas samma query till ES många gånger. Anrop med samma path och body som redan pågår väntar istället
+# på det pågående anropet och får samma svar. Används av es_transport för GET anrop (sökningar).
+
+# Samordningen görs inom processen (varje gunicorn worker för sig).
+
+# es_config.single_flight: False stänger av samordningen (default True)
+
+def isEnabled():
+	return getattr(es_config, 'single_flight', True)
+
+def requestKey(method, path, data):
+	# Nyckel för anropet, path och body (bytes eller str)
+	if isinstance(data, str):
+		data = data.encode('utf-8')
+
+	return hashlib.sha1(method.encode('ascii')+b' '+path.encode('utf-8')+b'\n'+(data or b'')).hexdigest()
+
+
+class Flight:
+	def __init__(self):
+		self.event = threading.Event()
+		self.response = None
+		self.error = None
+
+
+_flights = {}
+_flightsPid = None
+_lock = threading.Lock()
+
+def run(key, func):
+	# Anropar func (som gör anropet till ES) eller väntar på ett pågående anrop med samma nyckel och levererar dess svar
+	global _flights, _flightsPid
+
+	if not isEnabled():
+		return func()
+
+	with _lock:
+		# Pågående anrop följer inte med vid fork
+		if _flightsPid != os.getpid():
+			_flights = {}
+			_flightsPid = os.getpid()
+
+		flight = _flights.get(key)
+		leader = flight is None
+
+		if leader:
+			flight = Flight()
+			_flights[key] = flight
+
+	if not leader:
+		flight.event.wait()
+
+		if flight.error is not None:
+			raise flight.error
+
+		return flight.response
+
+	try:
+		flight.response = func()
+	except BaseException as e:
+		flight.error = e
+
+		raise
+	finally:
+		with _lock:
+			_flights.pop(key, None)
+
+		flight.event.set()
+
+	return flight.response
+
+
+# Pågående anrop från async views, per event loop
+_asyncFlights = weakref.WeakKeyDictionary()
+
+async def runAsync(key, func):
+	# Som run men för async views, func levererar en coroutine (t.ex. lambda: client.request(...))
+	# Anropet körs som en egen task som alla väntar på via shield, om en av de som väntar avbryts
+	# (t.ex. när klienten kopplar ner) fortsätter anropet för de andra
+	if not isEnabled():
+		return await func()
+
+	loop = asyncio.get_running_loop()
+	flights = _asyncFlights.setdefault(loop, {})
+
+	if key not in flights:
+		task = loop.create_task(func())
+		flights[key] = task
+
+		def done(task):
+			if flights.get(key) is task:
+				del flights[key]
+
+			# Markerar felet som hämtat om ingen väntar på svaret längre
+			if not task.cancelled():
+				task.exception()
+
+		task.add_done_callback(done)
+
+	return await asyncio.shield(flights[key])
@@ -0,0 +1,222 @@
+import functools, glob, gzip, hashlib, inspect, mmap, os, tempfile, threading, time
+from django.http import HttpResponse, HttpResponseNotModified
+
+import es_config
+from . import es_transport, index_generation, conditional_get
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Färdigberäknade svar (snapshots) för endpoints som inte tar några params och bara ändras när indexet ändras (total_by_type/*)
+
+# Svaren byggs en gång per version av indexet (se index_generation.py) och sparas gzippade på disk
+# som [index_name]-[version]-[namn].json.gz. Varje process läser in filerna via mmap och levererar dem direkt
+# (gzippade om klienten accepterar det) med ETag, If-None-Match besvaras med 304.
+
+# Snapshots byggs via management kommandot build_snapshots (t.ex. efter omindexering) eller av en bakgrundstråd
+# i varje process som kontrollerar indexets version med jämna mellanrum och bygger de snapshots som saknas.
+# En lås fil gör att bara en process bygger snapshots för en version, övriga väntar på filerna.
+# Tills snapshots finns (och när showQuery anges) anropas view som tidigare.
+
+# Inställningar som läses från es_config (alla är valfria):
+# snapshot_enabled: False stänger av snapshots (default True)
+# snapshot_dir: katalog för snapshot filer (default [tempdir]/sagenkarta_es_api_snapshots)
+# snapshot_refresh: sekunder mellan kontroller av indexets version (default 300)
+# snapshot_retry: sekunder innan nytt försök om kontrollen misslyckades (default 60)
+# snapshot_build_timeout: max antal sekunder för att bygga en snapshot och som en process väntar på att en annan process bygger snapshots (default 600)
+
+# Views som snapshots byggs från, namn: view utan decorators (se snapshotResponse)
+builders = {}
+
+def isEnabled():
+	return getattr(es_config, 'snapshot_enabled', True)
+
+def getDir():
+	return getattr(es_config, 'snapshot_dir', os.path.join(tempfile.gettempdir(), 'sagenkarta_es_api_snapshots'))
+
+def getPath(name, version):
+	return os.path.join(getDir(), es_config.index_name+'-'+version+'-'+name+'.json.gz')
+
+
+class Snapshot:
+	# Gzippat svar från en snapshot fil, läses via mmap
+	def __init__(self, name, version, path):
+		self.name = name
+		self.version = version
+
+		with open(path, 'rb') as f:
+			self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		self.etag = '"'+version+'-'+hashlib.sha1(self.data).hexdigest()[:16]+'"'
+
+	def response(self, request):
+		if conditional_get.etagMatches(request, self.etag):
+			response = HttpResponseNotModified()
+		elif 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+			response = HttpResponse(self.data[:], content_type='application/json')
+			response['Content-Encoding'] = 'gzip'
+		else:
+			response = HttpResponse(gzip.decompress(self.data[:]), content_type='application/json')
+
+		response['ETag'] = self.etag
+		response['Vary'] = 'Accept-Encoding'
+		response['Access-Control-Allow-Origin'] = '*'
+
+		return response
+
+
+def buildSnapshot(name, version):
+	# Anropar view och sparar svaret, filen skrivs till en temporär fil först så att andra processer aldrig läser en halv fil
+	start = time.perf_counter()
+
+	content = builders[name](None).content
+
+	path = getPath(name, version)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	tmpFd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+
+	try:
+		with os.fdopen(tmpFd, 'wb') as f:
+			f.write(gzip.compress(content))
+
+		os.replace(tmpPath, path)
+	except BaseException:
+		os.unlink(tmpPath)
+
+		raise
+
+	logger.info('snapshot %s built in %.2f s', name, time.perf_counter()-start)
+
+def removeOldSnapshots(version):
+	# Tar bort snapshot filer för tidigare versioner av indexet
+	for path in glob.glob(os.path.join(getDir(), glob.escape(es_config.index_name)+'-*.json.gz')):
+		if not os.path.basename(path).startswith(es_config.index_name+'-'+version+'-'):
+			try:
+				os.unlink(path)
+			except OSError:
+				pass
+
+def acquireBuildLock(version):
+	# Lås fil ([index_name]-[version].building) som skapas med O_EXCL, bara en process bygger snapshots för en version åt gången
+	# Levererar path till lås filen eller None om en annan process redan bygger
+	path = os.path.join(getDir(), es_config.index_name+'-'+version+'.building')
+	os.makedirs(getDir(), exist_ok=True)
+
+	try:
+		os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+
+		return path
+	except FileExistsError:
+		# Lås från en process som har avbrutits under bygget tas bort efter dubbla snapshot_build_timeout sekunder
+		# (ett pågående bygge tar max snapshot_build_timeout sekunder per snapshot, se build)
+		try:
+			if time.time()-os.path.getmtime(path) > 2*getattr(es_config, 'snapshot_build_timeout', 600):
+				os.unlink(path)
+		except OSError:
+			pass
+
+		return None
+
+def build(force = False):
+	# Bygger snapshots som saknas för nuvarande version av indexet (alla om force), anrop till ES görs parallellt
+	# Om en annan process bygger snapshots för samma version väntas på att den blir klar (max snapshot_build_timeout sekunder)
+	# Levererar versionen
+	version = index_generation.fetchGeneration()
+
+	deadline = time.monotonic()+getattr(es_config, 'snapshot_build_timeout', 600)
+
+	while force or any(not os.path.exists(getPath(name, version)) for name in builders):
+		lockPath = acquireBuildLock(version)
+
+		if lockPath is not None:
+			try:
+				# Snapshots kan ha byggts av en annan process medan vi väntade på låset
+				names = [name for name in builders if force or not os.path.exists(getPath(name, version))]
+
+				# Varje snapshot får max snapshot_build_timeout sekunder, runParallel väntar in anrop som pågår
+				# även vid fel så att låset inte släpps medan ett bygge fortfarande körs
+				es_transport.runParallel([functools.partial(buildSnapshot, name, version) for name in names],
+										 timeout=getattr(es_config, 'snapshot_build_timeout', 600))
+			finally:
+				try:
+					os.unlink(lockPath)
+				except OSError:
+					pass
+
+			break
+
+		if time.monotonic() > deadline:
+			raise Exception('timeout waiting for snapshots built by another process')
+
+		time.sleep(1)
+
+	removeOldSnapshots(version)
+
+	return version
+
+_snapshots = {}
+_thread = None
+_threadPid = None
+_lock = threading.Lock()
+
+def load():
+	# Bygger snapshots som saknas och läser in dem, byter ut alla snapshots i ett steg
+	global _snapshots
+
+	version = build()
+
+	if any(name not in _snapshots or _snapshots[name].version != version for name in builders):
+		_snapshots = dict((name, Snapshot(name, version, getPath(name, version))) for name in builders)
+
+		logger.info('snapshots loaded for index version %s', version)
+
+def _run():
+	while True:
+		try:
+			load()
+			interval = getattr(es_config, 'snapshot_refresh', 300)
+		except Exception:
+			logger.exception('snapshots could not be loaded')
+			interval = getattr(es_config, 'snapshot_retry', 60)
+
+		time.sleep(interval)
+
+def _start():
+	# Startar bakgrundstråden om den inte finns i nuvarande process (trådar följer inte med vid fork)
+	global _thread, _threadPid
+
+	pid = os.getpid()
+
+	if _thread is None or _threadPid != pid:
+		with _lock:
+			if _thread is None or _threadPid != pid:
+				_thread = threading.Thread(target=_run, name='snapshots', daemon=True)
+				_threadPid = pid
+				_thread.start()
+
+def getSnapshot(name):
+	# Levererar snapshot för name, None om den inte har lästs in än
+	_start()
+
+	return _snapshots.get(name)
+
+def snapshotResponse(name):
+	# Decorator för views utan params, svaret levereras från snapshot om den finns, annars anropas view
+	# Snapshot byggs genom att anropa view utan decorators (t.ex. response_cache.cachedResponse) med request = None
+	def decorator(view):
+		builders[name] = inspect.unwrap(view)
+
+		@functools.wraps(view)
+		def wrapper(request, *args, **kwargs):
+			if isEnabled() and request.method in ('GET', 'HEAD') and not 'showQuery' in request.GET:
+				snapshot = getSnapshot(name)
+
+				if snapshot is not None:
+					return snapshot.response(request)
+
+			return view(request, *args, **kwargs)
+
+		return wrapper
+
+	return decorator
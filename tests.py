@@ -1,3 +1,269 @@
-from django.test import TestCase
+import copy, json
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory
+
+import es_config
+from . import es_transport, geohash, response_cache
+from .views import createQuery
+
+# Params som testas, kombinationer av relevans params (search, terms, similar) och filter params
+queryParams = [
+	{'type': 'arkiv,tryckt'},
+	{'category': 'L,H', 'collection_years': '1880,1920'},
+	{'socken_id': '202,243', 'gender': 'i:female'},
+	{'search': 'svart hund', 'type': 'arkiv'},
+	{'search': '"svart hund"', 'phrase_options': 'near', 'landskap': 'Värmland'},
+	{'terms': 'natt,jul', 'birth_years': 'i:female:1850-1900'},
+	{'person': 'Ragnar Nilsson', 'informants_gender': 'male', 'only_geography': 'true'},
+	{'country': 'sweden', 'archive': 'ULMA', 'has_metadata': 'sitevision_url'}
+]
+
+# Params som ska påverka relevans och därför ligga i bool.must
+relevanceParams = ['search', 'search_all', 'terms', 'title_terms', 'similar']
+
+def legacyQuery(query):
+	# Samma query som createQuery byggde tidigare, alla clauses i bool.must
+	legacy = copy.deepcopy(query)
+	legacy['bool']['must'] = legacy['bool']['must']+legacy['bool'].pop('filter')
+
+	return legacy
+
+
+class CreateQueryFilterTest(SimpleTestCase):
+	def setUp(self):
+		self.factory = RequestFactory()
+
+	def test_relevance_clauses_in_must(self):
+		for params in queryParams:
+			query = createQuery(self.factory.get('/documents/', params))
+
+			relevanceCount = len([param for param in params if param in relevanceParams])
+
+			self.assertEqual(len(query['bool']['must']), relevanceCount, params)
+			self.assertEqual(len(query['bool']['must'])+len(query['bool']['filter']), len(legacyQuery(query)['bool']['must']), params)
+
+	def test_identical_hit_sets(self):
+		# Jämför träffar från ES för query med bool.filter och samma query med alla clauses i bool.must
+		def hitIds(query):
+			esResponse = es_transport.esGet('/'+es_config.index_name+'/legend/_search',
+											data=json.dumps({
+												'query': query,
+												'size': 1000,
+												'_source': False,
+												'sort': ['_doc']
+											}),
+											headers={'content-type': 'application/json'})
+			responseData = esResponse.json()
+
+			total = responseData['hits']['total']
+
+			return total['value'] if isinstance(total, dict) else total, sorted(hit['_id'] for hit in responseData['hits']['hits'])
+
+		try:
+			es_transport.esGet('/'+es_config.index_name)
+		except Exception:
+			self.skipTest('Elasticsearch is not available')
+
+		for params in queryParams:
+			query = createQuery(self.factory.get('/documents/', params))
+
+			self.assertEqual(hitIds(query), hitIds(legacyQuery(query)), params)
+
+
+class SessionAdapterTest(SimpleTestCase):
+	def setUp(self):
+		patchers = [
+			mock.patch.object(es_config, 'protocol', 'https://', create=True),
+			mock.patch.object(es_config, 'host', 'es1.example.com:9200', create=True),
+			mock.patch.object(es_config, 'user', 'user', create=True),
+			mock.patch.object(es_config, 'password', 'password', create=True),
+			mock.patch.object(es_config, 'pool_sizes', {'es1.example.com:9200': 20}, create=True)
+		]
+
+		for patcher in patchers:
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_host_adapter_with_credentials(self):
+		# Url från getUrl ska matcha adaptern för host i pool_sizes även när inloggning används
+		session = es_transport._createSession()
+		adapter = session.get_adapter(es_transport.getUrl('/index/_search'))
+
+		self.assertIs(adapter, session.adapters['https://es1.example.com:9200'])
+		self.assertEqual(adapter._pool_maxsize, 20)
+		self.assertEqual((session.auth.username, session.auth.password), ('user', 'password'))
+
+
+# Geohashes med olika längd (även udda) och koordinater som testas mot decode och encode
+geohashes = ['u', 'u6', 'u6s', 'u6sc', 'u6sce', 'u6scep', 'u6scepz', 'u6scepz9', 'u6scepz9b', 'u6scepz9bj', 'u6scepz9bjq', 'u6scepz9bjq4',
+			 's0000', 'zzzzzzzzzzzz', '000000000000', 'gcpvj0', '9q8yyk8yt']
+coordinates = [(59.3293, 18.0686), (55.605, 13.0038), (67.8558, 20.2253), (0.0, 0.0), (-89.999, -179.999), (89.999, 179.999),
+			   (12.5, 190.0), (-33.87, -200.5)]
+
+
+class GeohashManyTest(SimpleTestCase):
+	def assertSameAsBaseline(self):
+		geohash.decode_cached.cache_clear()
+
+		self.assertEqual(geohash.decode_many(geohashes), [geohash.decode(hashcode) for hashcode in geohashes])
+		self.assertEqual([geohash.decode_cached(hashcode) for hashcode in geohashes], [geohash.decode(hashcode) for hashcode in geohashes])
+
+		for precision in range(1, 13):
+			self.assertEqual(geohash.encode_many(coordinates, precision),
+							 [geohash.encode(latitude, longitude, precision) for latitude, longitude in coordinates], precision)
+
+	@skipIf(geohash.numpy is None, 'numpy is not installed')
+	def test_numpy(self):
+		self.assertSameAsBaseline()
+
+	def test_without_numpy(self):
+		# Ren Python, samma som när numpy saknas
+		with mock.patch.object(geohash, 'numpy', None):
+			self.assertSameAsBaseline()
+
+
+class CanonicalParamsTest(SimpleTestCase):
+	def setUp(self):
+		self.factory = RequestFactory()
+
+		# Nyckeln ska inte bero på indexets generation i testerna (hämtas annars från ES)
+		patcher = mock.patch.object(response_cache.index_generation, 'get', return_value=None)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def cacheKey(self, path, params):
+		return response_cache.cacheKey(self.factory.get(path, params))
+
+	def test_param_and_list_order(self):
+		self.assertEqual(self.cacheKey('/types/', {'type': 'tryckt,arkiv', 'category': 'L'}),
+						 self.cacheKey('/types/', {'category': 'L', 'type': 'arkiv,tryckt'}))
+
+	def test_ordered_params_keep_order(self):
+		# Ordningen i search påverkar query:en och sorteras inte
+		self.assertNotEqual(self.cacheKey('/documents/', {'search': 'svart,hund'}),
+							self.cacheKey('/documents/', {'search': 'hund,svart'}))
+
+	def test_repeated_params(self):
+		# createQuery läser sista värdet, ?type=a&type=b och ?type=b&type=a ger olika queries
+		self.assertNotEqual(self.cacheKey('/types/', {'type': ['arkiv', 'tryckt']}),
+							self.cacheKey('/types/', {'type': ['tryckt', 'arkiv']}))
+		self.assertEqual(self.cacheKey('/types/', {'type': ['tryckt', 'arkiv']}),
+						 self.cacheKey('/types/', {'type': 'arkiv'}))
+
+	def test_default_values_removed(self):
+		self.assertEqual(self.cacheKey('/types/', {'search_raw': 'false', 'type': 'arkiv'}),
+						 self.cacheKey('/types/', {'type': 'arkiv'}))
+
+	def test_default_values_case_sensitive(self):
+		# createQuery jämför värdet skiftlägeskänsligt, search_raw=FALSE ger en annan query än när param saknas
+		self.assertNotEqual(self.cacheKey('/types/', {'search_raw': 'FALSE', 'type': 'arkiv'}),
+							self.cacheKey('/types/', {'type': 'arkiv'}))
+
+	def test_path_in_key(self):
+		self.assertNotEqual(self.cacheKey('/get_socken/1/', {}), self.cacheKey('/get_socken/2/', {}))
+
+	def test_generation_in_key(self):
+		request = self.factory.get('/types/', {'type': 'arkiv'})
+
+		with mock.patch.object(response_cache.index_generation, 'get', return_value='a'):
+			key = response_cache.cacheKey(request)
+
+		with mock.patch.object(response_cache.index_generation, 'get', return_value='b'):
+			self.assertNotEqual(response_cache.cacheKey(request), key)
+
+
+class LocalMemoryBackendTest(SimpleTestCase):
+	def test_lru_eviction(self):
+		backend = response_cache.LocalMemoryBackend(10)
+
+		backend.set('a', 'A', 4, 300)
+		backend.set('b', 'B', 4, 300)
+
+		# a används senast, b tas bort när c inte får plats
+		self.assertEqual(backend.get('a'), 'A')
+		self.assertEqual(backend.set('c', 'C', 4, 300), 1)
+
+		self.assertIsNone(backend.get('b'))
+		self.assertEqual(backend.get('a'), 'A')
+		self.assertEqual(backend.get('c'), 'C')
+		self.assertEqual(backend.info()['bytes'], 8)
+
+	def test_too_large_entry_not_stored(self):
+		backend = response_cache.LocalMemoryBackend(10)
+
+		backend.set('a', 'A', 11, 300)
+
+		self.assertIsNone(backend.get('a'))
+		self.assertEqual(backend.info()['bytes'], 0)
+
+	def test_replace_entry(self):
+		backend = response_cache.LocalMemoryBackend(10)
+
+		backend.set('a', 'A', 4, 300)
+		backend.set('a', 'AA', 6, 300)
+
+		self.assertEqual(backend.get('a'), 'AA')
+		self.assertEqual(backend.info(), {'entries': 1, 'bytes': 6, 'max_bytes': 10})
+
+	def test_ttl(self):
+		backend = response_cache.LocalMemoryBackend(10)
+
+		with mock.patch.object(response_cache.time, 'time', return_value=1000):
+			backend.set('a', 'A', 4, 300)
+
+		with mock.patch.object(response_cache.time, 'time', return_value=1299):
+			self.assertEqual(backend.get('a'), 'A')
+
+		# Utgången post tas bort och räknas inte längre i storleken
+		with mock.patch.object(response_cache.time, 'time', return_value=1301):
+			self.assertIsNone(backend.get('a'))
+
+		self.assertEqual(backend.info()['bytes'], 0)
+
+
+class CachedResponseTest(SimpleTestCase):
+	def setUp(self):
+		self.factory = RequestFactory()
+
+		patchers = [
+			mock.patch.object(response_cache.index_generation, 'get', return_value=None),
+			mock.patch.object(response_cache, '_backend', response_cache.LocalMemoryBackend(1024*1024))
+		]
+
+		for patcher in patchers:
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def test_cached(self):
+		calls = []
+
+		@response_cache.cachedResponse
+		def view(request):
+			calls.append(request)
+
+			return HttpResponse(b'{}', content_type='application/json')
+
+		view(self.factory.get('/types/', {'type': 'tryckt,arkiv'}))
+		response = view(self.factory.get('/types/', {'type': 'arkiv,tryckt'}))
+
+		self.assertEqual(len(calls), 1)
+		self.assertEqual(response.content, b'{}')
+
+	def test_es_error_not_cached(self):
+		calls = []
+
+		@response_cache.cachedResponse
+		def view(request):
+			calls.append(request)
+
+			response = HttpResponse(b'{"error":{}}', content_type='application/json')
+			response.esStatusCode = 404
+
+			return response
+
+		view(self.factory.get('/document/1/'))
+		view(self.factory.get('/document/1/'))
+
+		self.assertEqual(len(calls), 2)
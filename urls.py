@@ -2,7 +2,14 @@ from django.conf.urls import url
 # from rest_framework.schemas import get_schema_view
 # from rest_framework_swagger.views import get_swagger_view
 # from rest_framework_swagger.renderers import SwaggerUIRenderer, OpenAPIRenderer
-from . import views
+import es_config
+from . import views, conditional_get
+
+# Async views för endpoints som bara anropar ES (es_config.async_views = True, kräver ASGI server), se async_views.py
+if getattr(es_config, 'async_views', False):
+	from . import async_views as endpointViews
+else:
+	endpointViews = views
 
 # schema_view = get_schema_view(title='Users API', renderer_classes=[OpenAPIRenderer, SwaggerUIRenderer])
 
@@ -20,6 +27,9 @@ urlpatterns = [
 	#	documents: list
 	url(r'^documents/', views.getDocuments, name='getDocuments'),
 
+	#	export av alla dokument som NDJSON
+	url(r'^export/documents/', views.getDocumentsExport, name='getDocumentsExport'),
+
 	# aggregate terms
 	url(r'^terms/', views.getTerms, name='getTerms'),
 
@@ -27,22 +37,22 @@ urlpatterns = [
 	url(r'^title_terms/', views.getTitleTerms, name='getTitleTerms'),
 
 	# aggregate upptackningsar
-	url(r'^collection_years/', views.getCollectionYears, name='getCollectionYears'),
+	url(r'^collection_years/', endpointViews.getCollectionYears, name='getCollectionYears'),
 
 	# aggregate fodelsear
-	url(r'^birth_years/', views.getBirthYears, name='getBirthYears'),
+	url(r'^birth_years/', endpointViews.getBirthYears, name='getBirthYears'),
 
 	# aggregate kategorier
-	url(r'^categories/', views.getCategories, name='getCategories'),
+	url(r'^categories/', endpointViews.getCategories, name='getCategories'),
 
 	# aggregate kategorier
 	url(r'^category_types/', views.getCategoryTypes, name='getCategoryTypes'),
 
 	# aggregate kategorier
-	url(r'^types/', views.getTypes, name='getTypes'),
+	url(r'^types/', endpointViews.getTypes, name='getTypes'),
 
 	# aggregate socken
-	url(r'^socken/', views.getSocken, name='getSocken'),
+	url(r'^socken/', endpointViews.getSocken, name='getSocken'),
 
 	# aggregate harad
 	url(r'^harad/', views.getHarad, name='getHarad'),
@@ -66,10 +76,10 @@ urlpatterns = [
 	url(r'^collectors/', views.getCollectors, name='getCollectors'),
 
 	# aggregate kon
-	url(r'^gender/', views.getGender, name='getGender'),
+	url(r'^gender/', endpointViews.getGender, name='getGender'),
 
 	# aggregate kon
-	url(r'^gender/', views.getGender, name='getGender'),
+	url(r'^gender/', endpointViews.getGender, name='getGender'),
 
 	# aggregate brev avsändings- och destinationort
 	url(r'^letters/', views.getLetters, name='getLetters'),
@@ -95,8 +105,24 @@ urlpatterns = [
 	url(r'^total_by_type/birth_years/', views.getBirthYearsTotal, name='getBirthYearsTotal'),
 	url(r'^total_by_type/gender/', views.getGenderTotal, name='getGenderTotal'),
 
+	# flera endpoints i ett anrop
+	url(r'^batch/', endpointViews.getBatch, name='getBatch'),
+
+	# tidsmätning av anrop till ES (Prometheus)
+	url(r'^metrics/', views.getMetrics, name='getMetrics'),
+
+	# person roller, materialtyper, kategorier, landskap och län
+	url(r'^dimensions/', views.getDimensions, name='getDimensions'),
+
+	# statistik för response cachen
+	url(r'^cache_stats/', views.getCacheStats, name='getCacheStats'),
+
 	url(r'^get_socken/(?P<sockenId>[^/]+)/$', views.getSocken, name='getSocken'),
 	url(r'^get_person/(?P<personId>[^/]+)/$', views.getPersons, name='getPersons'),
 	url(r'^random_document', views.getRandomDocument, name='getRandomDocument'),
 	url(r'^document/(?P<documentId>[^/]+)/$', views.getDocument, name='getDocument'),
 ]
+
+# ETag, 304 svar för If-None-Match och Cache-Control för alla views, se conditional_get.py
+for pattern in urlpatterns:
+	pattern.callback = conditional_get.conditionalResponse(pattern.callback, conditional_get.endpointClass(pattern.name))
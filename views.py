@@ -1,28 +1,34 @@
-from django.http import JsonResponse
-import requests, json, sys, os
+from django.http import HttpResponse, StreamingHttpResponse
+import requests, json, sys, os, re, base64, binascii, time
 from requests.auth import HTTPBasicAuth
 from random import randint
 
 import es_config
-#import geohash
+from . import es_transport, response_cache, json_backend, metrics, local_index, geohash, dimension_catalog, snapshots, index_generation
+from .json_backend import JsonResponse
 
 from django.db.models.functions import Now
 
 import logging
 logger = logging.getLogger(__name__)
 
+@metrics.timedPhase('create_query')
 def createQuery(request):
 	# Function som tar in request object och bygger upp Elasticsearch JSON query som skickas till es_config
 
 	# Den letar efter varje param som skickas via url:et (?search=söksträng&type=arkiv&...) och
-	# lägger till query object till bool.must i hela query:en
+	# lägger till query object till bool.must eller bool.filter i hela query:en
+
+	# Bara params som ska påverka relevans (search, search_all, terms, title_terms, similar) läggs i bool.must,
+	# alla andra params är rena filter och läggs i bool.filter. Filter påverkar inte score och kan cachas av ES.
 
 	# Mer om bool: https://www.elastic.co/guide/en/elasticsearch/reference/current/query-dsl-bool-query.html
 
 	if (len(request.GET) > 0):
 		query = {
 			'bool': {
-				'must': []
+				'must': [],
+				'filter': []
 			}
 		}
 	else:
@@ -45,7 +51,7 @@ def createQuery(request):
 					'transcriptionstatus': transcriptionstatus
 				}
 			})
-		query['bool']['must'].append(transcriptionstatus_should_bool)
+		query['bool']['filter'].append(transcriptionstatus_should_bool)
 
 # TODO transcriptiondate
 #		query['bool']['must']['match'].append({
@@ -58,7 +64,7 @@ def createQuery(request):
 	if ('collection_years' in request.GET):
 		collectionYears = request.GET['collection_years'].split(',')
 
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'range': {
 				'year': {
 					'gte': collectionYears[0],
@@ -135,7 +141,7 @@ def createQuery(request):
 
 	# Hämtar documenter som har speciell typ av metadata. Exempel: `has_metadata=sitevision_url` (hämtar kurerade postar för matkartan).
 	if ('has_metadata' in request.GET):
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'match': {
 				'metadata.type': request.GET['has_metadata']
 			}
@@ -173,7 +179,7 @@ def createQuery(request):
 
 			categoryBool['bool']['must'].append(categoryQuery)
 
-		query['bool']['must'].append(categoryBool)
+		query['bool']['filter'].append(categoryBool)
 
 
 	# Hämtar documenter av angiven typ (en eller flera). Exempel: `type=arkiv,tryckt`
@@ -192,7 +198,7 @@ def createQuery(request):
 					'materialtype': type
 				}
 			})
-		query['bool']['must'].append(typeShouldBool)
+		query['bool']['filter'].append(typeShouldBool)
 
 
 	# Hämtar documenter som har speciella ID.
@@ -211,7 +217,7 @@ def createQuery(request):
 					'_id': docId
 				}
 			})
-		query['bool']['must'].append(docIdShouldBool)
+		query['bool']['filter'].append(docIdShouldBool)
 
 
 	# Hämtar documenter samlat in i angiven socken (en eller flera). Exempel: (sägner från Göteborgs stad och Partille) `socken_id=202,243`
@@ -236,7 +242,7 @@ def createQuery(request):
 					}
 			})
 
-		query['bool']['must'].append(sockenShouldBool)
+		query['bool']['filter'].append(sockenShouldBool)
 
 
 	# Hämtar documenter samlat in i angiven socken, härad, landskap eller län, sök via namn (wildcard sökning). Exempel: `place=Bolle`
@@ -276,7 +282,7 @@ def createQuery(request):
 			}
 		})
 
-		query['bool']['must'].append(placeShouldBool)
+		query['bool']['filter'].append(placeShouldBool)
 
 
 	# Hämtar documenter samlat in i angiven socken, men här letar vi efter namn (wildcard sökning). Exempel: `socken=Fritsla`
@@ -301,7 +307,7 @@ def createQuery(request):
 					}
 			})
 
-		query['bool']['must'].append(sockenShouldBool)
+		query['bool']['filter'].append(sockenShouldBool)
 
 
 	# Hämtar documenter samlat in i angiven landskap. Exempel: `landskap=Värmland`
@@ -326,7 +332,7 @@ def createQuery(request):
 					}
 			})
 
-		query['bool']['must'].append(landskapShouldBool)
+		query['bool']['filter'].append(landskapShouldBool)
 
 
 	# Hämtar documenter var uppteckare eller informant matchar angivet namn. Exempel: (alla som heter Ragnar eller Nilsson) `person=Ragnar Nilsson`
@@ -360,7 +366,7 @@ def createQuery(request):
 					}
 				})
 
-			query['bool']['must'].append(personShouldBool)
+			query['bool']['filter'].append(personShouldBool)
 
 
 
@@ -395,7 +401,7 @@ def createQuery(request):
 					}
 				})
 
-			query['bool']['must'].append(personShouldBool)
+			query['bool']['filter'].append(personShouldBool)
 
 
 	# Hämtar documenter var uppteckare eller informant matchar angivet id.
@@ -429,7 +435,7 @@ def createQuery(request):
 					}
 				})
 
-			query['bool']['must'].append(personShouldBool)
+			query['bool']['filter'].append(personShouldBool)
 
 
 	if ('collector_id' in request.GET):
@@ -455,7 +461,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('informant_id' in request.GET):
@@ -481,7 +487,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('collector' in request.GET):
@@ -507,7 +513,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('informant' in request.GET):
@@ -533,7 +539,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('collectors_gender' in request.GET):
@@ -559,7 +565,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('informants_gender' in request.GET):
@@ -585,7 +591,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	# Hämtar documenter med koppling till personer av speciellt kön, möjligt att leta efter olika roll av personer. Exempel (informantar=män, upptecknare=kvinnor): gender=i:male,c:female
@@ -619,7 +625,7 @@ def createQuery(request):
 					}
 				})
 
-			query['bool']['must'].append(personShouldBool)
+			query['bool']['filter'].append(personShouldBool)
 
 	if ('birth_years' in request.GET):
 		birthYearsQueries = request.GET['birth_years'].split(',')
@@ -676,7 +682,7 @@ def createQuery(request):
 					}
 				})
 
-			query['bool']['must'].append(personShouldBool)
+			query['bool']['filter'].append(personShouldBool)
 
 
 	if ('collectors_birth_years' in request.GET):
@@ -707,7 +713,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('informants_birth_years' in request.GET):
@@ -738,7 +744,7 @@ def createQuery(request):
 			}
 		}
 
-		query['bool']['must'].append(personShouldBool)
+		query['bool']['filter'].append(personShouldBool)
 
 
 	if ('terms' in request.GET):
@@ -855,7 +861,7 @@ def createQuery(request):
 	# Hämtar dokument var place (socken) coordinator finns inom angived geo_box (top,left,bottom,right)
 	if ('geo_box' in request.GET):
 		latLngs = request.GET['geo_box'].split(',')
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'nested': {
 				'path': 'places',
 				'query': {
@@ -881,7 +887,7 @@ def createQuery(request):
 
 	# Hämtar dokument som måste innehålla socken object (places)
 	if ('only_geography' in request.GET and request.GET['only_geography'].lower() == 'true'):
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'nested': {
 				'path': 'places',
 				'query': {
@@ -898,7 +904,7 @@ def createQuery(request):
 
 	# Hämtar dokument som måste finnas i en kategory, kollar om taxonomy.category existerar
 	if ('only_categories' in request.GET and request.GET['only_categories'].lower() == 'true'):
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'exists': {
 				'field': 'taxonomy.category'
 			}
@@ -920,11 +926,11 @@ def createQuery(request):
 					'taxonomy.type': categorytype
 				}
 			})
-		query['bool']['must'].append(categorytypes_should_bool)
+		query['bool']['filter'].append(categorytypes_should_bool)
 
 	# Hämtar dokument från angivet land
 	if ('country' in request.GET):
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'term': {
 				'archive.country': request.GET['country'].lower()
 			}
@@ -932,7 +938,7 @@ def createQuery(request):
 
 	# Hämtar dokument från angivet arkiv (arkiv är dock inte standardiserad i databasen)
 	if ('archive' in request.GET):
-		query['bool']['must'].append({
+		query['bool']['filter'].append({
 			'term': {
 				'archive.archive.keyword': request.GET['archive']
 			}
@@ -940,7 +946,77 @@ def createQuery(request):
 
 	return query
 
-def esQuery(request, query, formatFunc = None, apiUrl = None, returnRaw = False):
+# Hittar took och hits.total i raw svaret från ES utan att parsa hela svaret
+# Första träffen är alltid top-level värdet, took är första fältet och hits.total kommer före hits.hits (och eventuella inner_hits)
+tookPattern = re.compile(rb'"took"\s*:\s*(\d+)')
+totalPattern = re.compile(rb'"hits"\s*:\s*\{\s*"total"\s*:\s*(\{[^}]*\}|\d+)')
+
+def rawJsonResponse(request, query, content):
+	# Levererar ES svaret (bytes) som det är med metadata section tillagd i slutet av objektet, istället för att
+	# parsa hela svaret till python objekt och sedan serialisera det igen. Används av esQuery när formatFunc saknas.
+	# Levererar None om svaret inte är ett json objekt, då används vanliga vägen i esQuery.
+	content = content.strip()
+
+	if not content.startswith(b'{') or not content.endswith(b'}'):
+		return None
+
+	tookMatch = tookPattern.search(content)
+	totalMatch = totalPattern.search(content)
+
+	metadata = {
+		'total': json_backend.loads(totalMatch.group(1)) if totalMatch else 0,
+		'took': int(tookMatch.group(1)) if tookMatch else 0
+	}
+
+	# Om vi har lagt till 'showQuery=true' till url:et lägger vi hela querien till metadata
+	if request is not None and ('showQuery' in request.GET) and request.GET['showQuery']:
+		metadata['query'] = query
+
+	separator = b',' if content[1:-1].strip() else b''
+
+	httpResponse = HttpResponse(content[:-1]+separator+b'"metadata":'+json_backend.dumps(metadata)+b'}', content_type='application/json')
+	httpResponse['Access-Control-Allow-Origin'] = '*'
+
+	return httpResponse
+
+def errorResponse(message, status = 400):
+	# Svar för felaktiga params (t.ex. batch_size som inte är ett tal)
+	jsonResponse = JsonResponse({
+		'error': message
+	}, status=status)
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	return jsonResponse
+
+def createOutputData(request, query, formatFunc, responseData, metadataFunc = None):
+	# Formaterar svar från ES (responseData) till outputData, används av esQuery och esMultiQuery
+
+	if (formatFunc):
+		# Om det finns formatFunc formatterar vi svaret och lägger i outputData.data
+		outputData = {
+			'data': formatFunc(responseData)
+		}
+	else:
+		# Om formatFunc finns inte lägger vi responseData direkt till outputData
+		outputData = responseData
+
+	# Lägger till metadata section till outputData med information om total dokument och tiden som det tog för ES att hämta data
+	outputData['metadata'] = {
+		'total': responseData['hits']['total'] if 'hits' in responseData else 0,
+		'took': responseData['took'] if 'took' in responseData else 0
+	}
+
+	# metadataFunc levererar extra fält till metadata (t.ex. after för paging)
+	if (metadataFunc):
+		outputData['metadata'].update(metadataFunc(responseData))
+
+	# Om vi har lagt till 'showQuery=true' till url:et lägger vi hela querien till outputData.metadata
+	if request is not None and ('showQuery' in request.GET) and request.GET['showQuery']:
+		outputData['metadata']['query'] = query
+
+	return outputData
+
+def esQuery(request, query, formatFunc = None, apiUrl = None, returnRaw = False, metadataFunc = None):
 	# Function som formulerar query och anropar ES
 
 	# Tar in request (Django Rest API request), Elasticsearch query som skapas av createQuery och formatFunc
@@ -953,8 +1029,10 @@ def esQuery(request, query, formatFunc = None, apiUrl = None, returnRaw = False)
 
 	# returnRaw: levererar raw outputData som python objekt, om returnRaw är inte 'true' levereras outputData som json
 
+	# metadataFunc: function som levererar extra fält till outputData.metadata (se usePagedAggregation)
+
 	# Anropar ES, bygger upp url från es_config och skickar data som json (query)
-	esUrl = es_config.protocol+(es_config.user+':'+es_config.password+'@' if hasattr(es_config, 'user') else '')+es_config.host+'/'+es_config.index_name+(apiUrl if apiUrl else '/legend/_search')
+	esPath = '/'+es_config.index_name+(apiUrl if apiUrl else '/legend/_search')
 
     # Remove queryObject if it is empty (Elasticsearch 7 seems to not like empty query object)
 	if 'query' in query:
@@ -965,60 +1043,465 @@ def esQuery(request, query, formatFunc = None, apiUrl = None, returnRaw = False)
 
 	headers = {'Accept': 'application/json', 'content-type': 'application/json'}
 
+	# Tidsmätning för varje fas, se metrics.py
+	timings = {}
+
 	#print("url, query %s %s", esUrl, query)
-	logger.debug("url, query %s %s", esUrl, query)
-	esResponse = requests.get(esUrl,
-							  data=json.dumps(query),
-							  verify=False,
-							  headers=headers)
+	logger.debug("url, query %s %s", esPath, query)
+	with metrics.timer(timings, 'es_request'):
+		esResponse = es_transport.esGet(esPath,
+										data=json_backend.dumps(query),
+										headers=headers)
 
+	# Utan formatFunc skickar vi ES svaret vidare utan att parsa det (bara metadata läggs till)
+	if not formatFunc and not returnRaw and not metadataFunc:
+		logger.debug("response status_code %s", esResponse.status_code)
+
+		with metrics.timer(timings, 'encode'):
+			httpResponse = rawJsonResponse(request, query, esResponse.content)
+
+		if httpResponse is not None:
+			httpResponse.esStatusCode = esResponse.status_code
+
+			metrics.emit(request, timings)
+
+			return httpResponse
 
 	# Tar emot svaret som json
-	responseData = esResponse.json()
+	with metrics.timer(timings, 'decode'):
+		responseData = json_backend.loads(esResponse.content)
 	message = esResponse.status_code
 	#if 'error' in responseData:
 		#message = message + responseData.get('error')
 	logger.debug("response status_code %s %s ", message, responseData)
 
-	if (formatFunc):
-		# Om det finns formatFunc formatterar vi svaret och lägger i outputData.data
-		outputData = {
-			'data': formatFunc(responseData)
-		}
-	else:
-		# Om formatFunc finns inte lägger vi responseData direkt till outputData
-		outputData = responseData
-
-	# Lägger till metadata section till outputData med information om total dokument och tiden som det tog för ES att hämta data
-	outputData['metadata'] = {
-		'total': responseData['hits']['total'] if 'hits' in responseData else 0,
-		'took': responseData['took'] if 'took' in responseData else 0
-	}
+	if 'took' in responseData:
+		timings['es_took'] = responseData['took']/1000.0
 
-	# Om vi har lagt till 'showQuery=true' till url:et lägger vi hela querien till outputData.metadata
-	if request is not None and ('showQuery' in request.GET) and request.GET['showQuery']:
-		outputData['metadata']['query'] = query
+	with metrics.timer(timings, 'format'):
+		outputData = createOutputData(request, query, formatFunc, responseData, metadataFunc)
 
 	# If returnRaw leverar vi outputData som objekt, men annars som JsonResponse med Access-Control-Allow-Origin header
 	# returnRaw används av functioner som behandlar svaret från esQuery och inte leverarar outputData direkt som svar till Rest API
 	if returnRaw:
+		metrics.emit(request, timings)
+
 		return outputData
 	else:
-		jsonResponse = JsonResponse(outputData)
+		with metrics.timer(timings, 'encode'):
+			jsonResponse = JsonResponse(outputData)
 		jsonResponse['Access-Control-Allow-Origin'] = '*'
+		jsonResponse.esStatusCode = esResponse.status_code
+
+		metrics.emit(request, timings)
 
 		return jsonResponse
 
+def encodeAfterKey(afterKey):
+	# Gör om after_key från composite aggregation till en sträng som kan skickas via url:et (after=)
+	return base64.urlsafe_b64encode(json_backend.dumps(afterKey)).decode('ascii')
+
+def decodeAfterKey(after):
+	return json_backend.loads(base64.urlsafe_b64decode(after.encode('ascii')))
+
+def createCompositeAggregation(field, aggs, size, after = None):
+	# Composite aggregation som ersätter terms aggregation, buckets hämtas sida för sida (sorterad på field)
+	aggregation = {
+		'composite': {
+			'size': size,
+			'sources': [
+				{
+					'key': {
+						'terms': {
+							'field': field
+						}
+					}
+				}
+			]
+		},
+		'aggs': aggs
+	}
+
+	if after is not None:
+		aggregation['composite']['after'] = after
+
+	return aggregation
+
+def getAggregation(aggregations, path):
+	# Hämtar aggregation från ES svaret (json['aggregations']) via lista av aggregation namn
+	for name in path:
+		aggregations = aggregations[name]
+
+	return aggregations
+
+def getQueryAggregationParent(query, path):
+	# Hämtar aggs object i query där sista aggregationen i path finns
+	aggs = query['aggs']
+
+	for name in path[:-1]:
+		aggs = aggs[name]['aggs']
+
+	return aggs
+
+def compositeBuckets(aggregation):
+	# Composite buckets har key som object ({ key: värde }), gör om till samma form som terms buckets
+	return [dict(bucket, key=bucket['key']['key']) for bucket in aggregation['buckets']]
+
+def pagingParamError(request):
+	# Kontrollerar after och count för usePagedAggregation och cursor och size för useCursor,
+	# levererar errorResponse (400) om de inte går att läsa, annars None
+	if 'after' in request.GET:
+		if 'count' in request.GET and (not request.GET['count'].isdigit() or int(request.GET['count']) < 1):
+			return errorResponse('count must be a positive integer')
+
+		if request.GET['after']:
+			try:
+				if not isinstance(decodeAfterKey(request.GET['after']), dict):
+					return errorResponse('after is not a valid page key')
+			except (binascii.Error, ValueError):
+				return errorResponse('after is not a valid page key')
+
+	if 'cursor' in request.GET:
+		if 'size' in request.GET and not request.GET['size'].isdigit():
+			return errorResponse('size must be a non-negative integer')
+
+		if request.GET['cursor']:
+			try:
+				if not isinstance(decodeAfterKey(request.GET['cursor']), list):
+					return errorResponse('cursor is not a valid cursor')
+			except (binascii.Error, ValueError):
+				return errorResponse('cursor is not a valid cursor')
+
+	return None
+
+def usePagedAggregation(request, query, path, jsonFormat):
+	# Paging av stora aggregationer via composite aggregation
+
+	# Om after finns i url:et (after= för första sidan, sedan after=[metadata.after från förra svaret]) byts terms aggregationen
+	# i path (t.ex. ['data', 'data'] för query['aggs']['data']['aggs']['data']) mot composite aggregation med samma sub-aggregationer.
+	# Sidans storlek anges via count (annars es_config.composite_page_size, default 1000). Buckets sorteras på key istället för doc_count.
+
+	# Levererar (jsonFormat, metadataFunc) som skickas till esQuery, metadata.after är None när det inte finns fler sidor
+	# after och count kontrolleras först via pagingParamError
+	if not 'after' in request.GET:
+		return jsonFormat, None
+
+	parentAggs = getQueryAggregationParent(query, path)
+	termsAggregation = parentAggs[path[-1]]
+
+	parentAggs[path[-1]] = createCompositeAggregation(termsAggregation['terms']['field'],
+													  termsAggregation['aggs'] if 'aggs' in termsAggregation else {},
+													  int(request.GET['count']) if 'count' in request.GET else getattr(es_config, 'composite_page_size', 1000),
+													  decodeAfterKey(request.GET['after']) if request.GET['after'] else None)
+
+	def pagedJsonFormat(json):
+		aggregation = getAggregation(json['aggregations'], path)
+		aggregation['buckets'] = compositeBuckets(aggregation)
+
+		return jsonFormat(json)
+
+	def metadataFunc(json):
+		aggregation = getAggregation(json['aggregations'], path)
+
+		return {
+			'after': encodeAfterKey(aggregation['after_key']) if 'after_key' in aggregation and len(aggregation['buckets']) > 0 else None
+		}
+
+	return pagedJsonFormat, metadataFunc
+
+def useCursor(request, query):
+	# Paging av documents/ och texts/ via search_after
+
+	# Om cursor finns i url:et (cursor= för första sidan, sedan cursor=[metadata.cursor från förra svaret]) hämtas nästa sida via search_after
+	# istället för from, varje sida kostar då lika mycket oavsett hur långt in i resultatet den ligger. Sorteringen görs stabil genom att
+	# lägga till _id (eller es_config.cursor_tiebreaker) sist i sort, utan sort param sorteras på _score först.
+
+	# Levererar metadataFunc som skickas till esQuery, metadata.cursor är None när det inte finns fler sidor
+	# cursor och size kontrolleras först via pagingParamError
+	if not 'cursor' in request.GET:
+		return None
+
+	tiebreaker = getattr(es_config, 'cursor_tiebreaker', '_id')
+
+	sort = query['sort'] if 'sort' in query else [
+		{
+			'_score': 'desc'
+		}
+	]
+	sort.append({
+		tiebreaker: 'asc'
+	})
+
+	query['sort'] = sort
+	query.pop('from', None)
+
+	if request.GET['cursor']:
+		query['search_after'] = decodeAfterKey(request.GET['cursor'])
+
+	# Med sort räknar ES inte _score om det inte anges
+	query['track_scores'] = True
+
+	def metadataFunc(json):
+		hits = json['hits']['hits']
+
+		return {
+			'cursor': encodeAfterKey(hits[-1]['sort']) if len(hits) > 0 and len(hits) >= int(query['size']) else None
+		}
+
+	return metadataFunc
+
+def esCompositeBuckets(request, query, path):
+	# Går igenom alla sidor av en composite aggregation (i path, se usePagedAggregation) och levererar buckets en i taget
+	# Används internt när alla buckets behövs utan gräns på 10000, buckets har key i samma form som terms buckets
+	compositeAggregation = getQueryAggregationParent(query, path)[path[-1]]
+
+	while True:
+		responseData = esQuery(request, query, None, None, True)
+
+		aggregation = getAggregation(responseData['aggregations'], path)
+
+		for bucket in compositeBuckets(aggregation):
+			yield bucket
+
+		if not 'after_key' in aggregation or len(aggregation['buckets']) == 0:
+			break
+
+		compositeAggregation['composite']['after'] = aggregation['after_key']
+
+def isStreaming(request):
+	# stream=true: svaret skickas som StreamingHttpResponse (se esStreamingQuery)
+	return 'stream' in request.GET and request.GET['stream'].lower() == 'true' and not 'after' in request.GET and not 'cursor' in request.GET
+
+def esStreamingQuery(request, query, itemPath, jsonFormat):
+	# Som esQuery men svaret från ES parsas inkrementellt (json_backend.iterateItems) och varje objekt i itemPath
+	# (t.ex. ['hits', 'hits'] eller ['aggregations', 'data', 'data', 'buckets']) formateras och skickas till klienten ett i taget,
+	# så att hela listan aldrig finns i minnet. Svaret har samma form som från esQuery: { data: [...], metadata: {...} }
+
+	# Objekten formateras i batchar (max stream_batch_size objekt) med jsonFormat genom att skicka ett svar som bara innehåller batchen,
+	# så att t.ex. koordinater för socknar hämtas för hela batchen i ett anrop (se resolveLocations)
+	def batchFormat(items):
+		itemJson = items
+
+		for key in reversed(itemPath):
+			itemJson = {
+				key: itemJson
+			}
+
+		return jsonFormat(itemJson)
+
+	# Remove queryObject if it is empty (Elasticsearch 7 seems to not like empty query object)
+	if 'query' in query and not query['query']:
+		query.pop('query', None)
+
+	headers = {'Accept': 'application/json', 'content-type': 'application/json'}
+
+	esPath = '/'+es_config.index_name+'/legend/_search'
+
+	timings = {}
+
+	logger.debug("url, query %s %s", esPath, query)
+	with metrics.timer(timings, 'es_request'):
+		esResponse = es_transport.esGet(esPath,
+										data=json_backend.dumps(query),
+										headers=headers,
+										stream=True)
+
+	metrics.emit(request, timings)
+
+	# Fel från ES skickas vidare som det är innan streaming startar (ett felsvar har inga objekt i itemPath)
+	if esResponse.status_code != 200:
+		try:
+			httpResponse = HttpResponse(esResponse.content, status=esResponse.status_code, content_type='application/json')
+		finally:
+			esResponse.close()
+
+		httpResponse['Access-Control-Allow-Origin'] = '*'
+		httpResponse.esStatusCode = esResponse.status_code
+
+		return httpResponse
+
+	def streamContent():
+		values = {
+			'took': None,
+			'hits.total': None
+		}
+
+		try:
+			esResponse.raw.decode_content = True
+
+			yield b'{"data":['
+
+			separator = b''
+
+			batchSize = getattr(es_config, 'stream_batch_size', 1000)
+			batch = []
+
+			for item in json_backend.iterateItems(esResponse.raw, '.'.join(itemPath)+'.item', values):
+				batch.append(item)
+
+				if len(batch) >= batchSize:
+					for outputItem in batchFormat(batch):
+						yield separator+json_backend.dumps(outputItem)
+						separator = b','
+
+					batch = []
+
+			for outputItem in batchFormat(batch) if len(batch) > 0 else []:
+				yield separator+json_backend.dumps(outputItem)
+				separator = b','
+
+			metadata = {
+				'total': values['hits.total'] if values['hits.total'] is not None else 0,
+				'took': values['took'] if values['took'] is not None else 0
+			}
+
+			# Om vi har lagt till 'showQuery=true' till url:et lägger vi hela querien till metadata
+			if ('showQuery' in request.GET) and request.GET['showQuery']:
+				metadata['query'] = query
+
+			yield b'],"metadata":'+json_backend.dumps(metadata)+b'}'
+		finally:
+			esResponse.close()
+
+	streamingResponse = StreamingHttpResponse(streamContent(), content_type='application/json')
+	streamingResponse['Access-Control-Allow-Origin'] = '*'
+
+	return streamingResponse
+
+def createErrorOutputData(error, status):
+	# outputData för en query där ES har levererat fel, används för endpoints i batch/ (se esMultiQuery)
+	return {
+		'error': error,
+		'status': status,
+		'metadata': {
+			'total': 0,
+			'took': 0
+		}
+	}
+
+def esMultiQuery(request, queries):
+	# Skickar flera queries till ES i ett enda _msearch anrop
+
+	# queries: lista av (query, formatFunc)
+	# Levererar lista av outputData i samma ordning som queries, samma som esQuery(..., returnRaw=True) för varje query
+	body = b''
+
+	for query, formatFunc in queries:
+		# Remove queryObject if it is empty (Elasticsearch 7 seems to not like empty query object)
+		if 'query' in query and not query['query']:
+			query.pop('query', None)
+
+		body += b'{}\n'+json_backend.dumps(query)+b'\n'
+
+	headers = {'Accept': 'application/json', 'content-type': 'application/x-ndjson'}
+
+	esPath = '/'+es_config.index_name+'/legend/_msearch'
+
+	# Tidsmätning för varje fas, se metrics.py
+	timings = {}
+
+	logger.debug("url, queries %s %s", esPath, body)
+	with metrics.timer(timings, 'es_request'):
+		esResponse = es_transport.esGet(esPath,
+										data=body,
+										headers=headers)
+
+	with metrics.timer(timings, 'decode'):
+		responseData = json_backend.loads(esResponse.content)
+	logger.debug("response status_code %s", esResponse.status_code)
+
+	if 'took' in responseData:
+		timings['es_took'] = responseData['took']/1000.0
+
+	# Om hela anropet misslyckas (t.ex. 400 eller 429) levereras felet från ES för varje query
+	if esResponse.status_code != 200 or 'responses' not in responseData:
+		queryResponses = [{
+			'error': responseData.get('error', responseData) if isinstance(responseData, dict) else responseData,
+			'status': esResponse.status_code if esResponse.status_code != 200 else 500
+		}]*len(queries)
+	else:
+		queryResponses = responseData['responses']
+
+	ret = []
+
+	with metrics.timer(timings, 'format'):
+		for (query, formatFunc), queryResponse in zip(queries, queryResponses):
+			if 'error' in queryResponse:
+				ret.append(createErrorOutputData(queryResponse['error'], queryResponse.get('status', 500)))
+			else:
+				ret.append(createOutputData(request, query, formatFunc, queryResponse))
+
+	metrics.emit(request, timings)
+
+	return ret
+
 def getDocument(request, documentId):
 	# Hämtar enda dokument, använder inte esQuery för den anropar ES direkt
-	esResponse = requests.get(es_config.protocol+(es_config.user+':'+es_config.password+'@' if hasattr(es_config, 'user') else '')+es_config.host+'/'+es_config.index_name+'/legend/'+documentId, verify=False)
+	esResponse = es_transport.esGet('/'+es_config.index_name+'/legend/'+documentId)
+
+	# Svaret från ES skickas vidare som det är, utan att parsa och serialisera det igen
+	httpResponse = HttpResponse(esResponse.content, content_type='application/json')
+	httpResponse['Access-Control-Allow-Origin'] = '*'
+	httpResponse.esStatusCode = esResponse.status_code
+
+	return httpResponse
+
+
+def esQueryByType(request, aggs, formatFunc):
+	# Hämtar aggregationer per materialtype i ett enda anrop till ES, materialtype är yttre bucket och aggs läggs under varje typ
+	# Levererar samma svar som ett esQuery anrop (med returnRaw) per typ: { typ: { data: ..., metadata: { total, took } } }
+
+	# formatFunc får samma struktur som om svaret hade kommit från ett separat anrop för typen ({ 'aggregations': ... })
+	query = {
+		'size': 0,
+		'aggs': {
+			'types': {
+				'terms': {
+					'field': 'materialtype',
+					'size': 10000,
+					'order': {
+						'_term': 'asc'
+					}
+				},
+				'aggs': aggs
+			}
+		}
+	}
+
+	responseData = esQuery(request, query, None, None, True)
+
+	response = {}
+
+	for typeBucket in responseData['aggregations']['types']['buckets']:
+		typeAggregations = dict((key, typeBucket[key]) for key in typeBucket if key not in ('key', 'doc_count'))
+
+		# total har samma form som hits.total från ES (siffra eller { value, relation } beroende på ES version)
+		if isinstance(responseData['metadata']['total'], dict):
+			total = {
+				'value': typeBucket['doc_count'],
+				'relation': 'eq'
+			}
+		else:
+			total = typeBucket['doc_count']
+
+		response[typeBucket['key']] = {
+			'data': formatFunc({
+				'aggregations': typeAggregations
+			}),
+			'metadata': {
+				'total': total,
+				'took': responseData['metadata']['took']
+			}
+		}
 
-	jsonResponse = JsonResponse(esResponse.json())
+		if 'query' in responseData['metadata']:
+			response[typeBucket['key']]['metadata']['query'] = responseData['metadata']['query']
+
+	jsonResponse = JsonResponse(response)
 	jsonResponse['Access-Control-Allow-Origin'] = '*'
 
 	return jsonResponse
 
-
 def getRandomDocument(request):
 	query = {
 		'size': 1,
@@ -1036,6 +1519,7 @@ def getRandomDocument(request):
 	esQueryResponse = esQuery(request, query)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getTerms(request):
 	# Aggrigerar terms (topic_10_10 fält)
 
@@ -1100,7 +1584,68 @@ def getTerms(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+def loadTermDictionary(path):
+	# Levererar loader som hämtar alla termer i path (t.ex. topics_10_10) från ES (composite aggregation, sida för sida)
+	# med antal dokument (doc_count) och antal förekomster (terms), för autocomplete/terms/ och autocomplete/title_terms/
+	def loader():
+		query = {
+			'size': 0,
+			'aggs': {
+				'data': {
+					'nested': {
+						'path': path
+					},
+					'aggs': {
+						'data': {
+							'nested': {
+								'path': path+'.terms'
+							},
+							'aggs': {
+								'data': createCompositeAggregation(path+'.terms.term', {
+									'parent_doc_count': {
+										'reverse_nested': {}
+									}
+								}, getattr(es_config, 'composite_page_size', 1000))
+							}
+						}
+					}
+				}
+			}
+		}
+
+		terms = []
+
+		for bucket in esCompositeBuckets(None, query, ['data', 'data', 'data']):
+			terms.append({
+				'term': bucket['key'],
+				'doc_count': bucket['parent_doc_count']['doc_count'],
+				'terms': bucket['doc_count']
+			})
+
+		return local_index.TermDictionary(terms)
+
+	return loader
+
+termsIndex = local_index.LocalIndex('terms', loadTermDictionary('topics_10_10'))
+titleTermsIndex = local_index.LocalIndex('title_terms', loadTermDictionary('title_topics_10_10'))
+
+def termDictionaryResponse(request, index):
+	# Termer som börjar med söksträngen från lokal term dictionary, samma ordning som terms aggregation i ES (flest förekomster först)
+	timings = {}
+
+	with metrics.timer(timings, 'local_lookup'):
+		data = sorted(index.prefixSearch(request.GET['search']), key=lambda item: (-item['terms'], item['term']))
+
+	return localIndexResponse(request, data[:int(request.GET['count']) if 'count' in request.GET else 100], timings)
+
+@response_cache.cachedResponse
 def getTermsAutocomplete(request):
+	# Termer som börjar med söksträngen, från lokal term dictionary (se loadTermDictionary) om den har laddats, annars från ES
+	index = termsIndex.get()
+
+	if index is not None:
+		return termDictionaryResponse(request, index)
+
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -1128,15 +1673,16 @@ def getTermsAutocomplete(request):
 				'aggs': {
 					'data': {
 						'nested': {
-							'path': 'topics.10_10.terms'
+							'path': 'topics_10_10.terms'
 						},
 						'aggs': {
 							'data': {
 								'filter': {
 									'bool': {
+										# Samma matchning som TermDictionary.prefixSearch (termer som börjar med eller är lika med söksträngen)
 										'must': {
-											'regexp': {
-												'topics.10_10.terms.term': request.GET['search']+'.+'
+											'wildcard': {
+												'topics_10_10.terms.term': wildcardValue(request.GET['search'])+'*'
 											}
 										}
 									}
@@ -1169,6 +1715,7 @@ def getTermsAutocomplete(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getTitleTerms(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -1254,7 +1801,14 @@ def getTitleTerms(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getTitleTermsAutocomplete(request):
+	# Termer som börjar med söksträngen, från lokal term dictionary (se loadTermDictionary) om den har laddats, annars från ES
+	index = titleTermsIndex.get()
+
+	if index is not None:
+		return termDictionaryResponse(request, index)
+
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -1288,9 +1842,10 @@ def getTitleTermsAutocomplete(request):
 							'data': {
 								'filter': {
 									'bool': {
+										# Samma matchning som TermDictionary.prefixSearch (termer som börjar med eller är lika med söksträngen)
 										'must': {
-											'regexp': {
-												'title_topics_10_10.terms.term': request.GET['search']+'.+'
+											'wildcard': {
+												'title_topics_10_10.terms.term': wildcardValue(request.GET['search'])+'*'
 											}
 										}
 									}
@@ -1323,6 +1878,8 @@ def getTitleTermsAutocomplete(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@snapshots.snapshotResponse('collection_years_total')
+@response_cache.cachedResponse
 def getCollectionYearsTotal(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -1336,66 +1893,33 @@ def getCollectionYearsTotal(request):
 	def jsonFormat(json):
 		return list(map(itemFormat, json['aggregations']['data']['data']['buckets']))
 
-	query = {
-		'size': 0,
-		'aggs': {
-			'data': {
-				'terms': {
-					'field': 'materialtype',
-					'size': 10000,
-					'order': {
-						'_term': 'asc'
+	aggs = {
+		'data': {
+			'filter': {
+				'range': {
+					'year': {
+						'lte': 2020
 					}
 				}
-			}
-		}
-	}
-
-	response = {}
-
-	typesResponse = esQuery(request, query, None, None, True)
-
-	for type in typesResponse['aggregations']['data']['buckets']:
-		query = {
-			'query': {
-				'query_string': {
-					'query': 'materialtype: '+type['key']
-				}
 			},
-			'size': 0,
 			'aggs': {
 				'data': {
-					'filter': {
-						'range': {
-							'year': {
-								'lte': 2020
-							}
-						}
-					},
-					'aggs': {
-						'data': {
-							'date_histogram' : {
-								'field' : 'year',
-								'interval' : 'year',
-								'format': 'yyyy'
-							}
-						}
+					'date_histogram' : {
+						'field' : 'year',
+						'interval' : 'year',
+						'format': 'yyyy'
 					}
 				}
 			}
 		}
+	}
 
-		queryResponse = esQuery(request, query, jsonFormat, None, True)
-
-		response[type['key']] = type['doc_count'] = queryResponse
-
-
-	jsonResponse = JsonResponse(response)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
+	# Anropar esQueryByType som hämtar aggregationen för alla materialtyper i ett anrop
+	return esQueryByType(request, aggs, jsonFormat)
 
-	return jsonResponse
+def createCollectionYearsQuery(request, queryObject):
+	# Bygger upp query för getCollectionYears utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
 
-def getCollectionYears(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -1409,7 +1933,7 @@ def getCollectionYears(request):
 		return list(map(itemFormat, json['aggregations']['data']['data']['buckets']))
 
 	query = {
-		'query': createQuery(request),
+		'query': queryObject,
 		'size': 0,
 		'aggs': {
 			'data': {
@@ -1433,10 +1957,18 @@ def getCollectionYears(request):
 		}
 	}
 
+	return query, jsonFormat
+
+@response_cache.cachedResponse
+def getCollectionYears(request):
+	query, jsonFormat = createCollectionYearsQuery(request, createQuery(request))
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@snapshots.snapshotResponse('birth_years_total')
+@response_cache.cachedResponse
 def getBirthYearsTotal(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -1459,21 +1991,6 @@ def getBirthYearsTotal(request):
 
 		return ret
 
-	query = {
-		'size': 0,
-		'aggs': {
-			'data': {
-				'terms': {
-					'field': 'materialtype',
-					'size': 10000,
-					'order': {
-						'_term': 'asc'
-					}
-				}
-			}
-		}
-	}
-
 	def createAggregations(roles):
 		aggs = {
 			'all': {
@@ -1533,34 +2050,14 @@ def getBirthYearsTotal(request):
 
 		return aggs
 
-	roles = getPersonRoles(None)
-
-	response = {}
-
-	typesResponse = esQuery(request, query, None, None, True)
-
-	for type in typesResponse['aggregations']['data']['buckets']:
-		query = {
-			'query': {
-				'query_string': {
-					'query': 'materialtype: '+type['key']
-				}
-			},
-			'size': 0,
-			'aggs': createAggregations(roles)
-		}
-
-		queryResponse = esQuery(request, query, jsonFormat, None, True)
-
-		response[type['key']] = type['doc_count'] = queryResponse
-
+	roles = getPersonRoles()
 
-	jsonResponse = JsonResponse(response)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
+	# Anropar esQueryByType som hämtar aggregationen för alla materialtyper i ett anrop
+	return esQueryByType(request, createAggregations(roles), jsonFormat)
 
-	return jsonResponse
+def createBirthYearsQuery(request, queryObject):
+	# Bygger upp query för getBirthYears utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
 
-def getBirthYears(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -1575,6 +2072,9 @@ def getBirthYears(request):
 		ret = {}
 
 		for agg in json['aggregations']:
+			if not hasRoleAggregation(json, agg):
+				continue
+
 			if 'buckets' in json['aggregations'][agg]['data']:
 				ret[agg] = list(map(itemFormat, json['aggregations'][agg]['data']['buckets']))
 			elif 'buckets' in json['aggregations'][agg]['data']['data']:
@@ -1641,19 +2141,27 @@ def getBirthYears(request):
 
 		return aggs
 
-	roles = getPersonRoles(request)
+	roles = getPersonRoles()
 
 	query = {
-		'query': createQuery(request),
+		'query': queryObject,
 		'size': 0,
 		'aggs': createAggregations(roles)
 	}
 
+	return query, jsonFormat
+
+@response_cache.cachedResponse
+def getBirthYears(request):
+	query, jsonFormat = createBirthYearsQuery(request, createQuery(request))
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
-def getCategories(request):
+def createCategoriesQuery(request, queryObject):
+	# Bygger upp query för getCategories utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
+
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		retObj = {
@@ -1674,7 +2182,7 @@ def getCategories(request):
 		return list(map(itemFormat, json['aggregations']['data']['buckets']))
 
 	query = {
-		'query': createQuery(request),
+		'query': queryObject,
 		'size': 0,
 		'aggs': {
 			'data': {
@@ -1701,10 +2209,17 @@ def getCategories(request):
 		}
 	}
 
+	return query, jsonFormat
+
+@response_cache.cachedResponse
+def getCategories(request):
+	query, jsonFormat = createCategoriesQuery(request, createQuery(request))
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getCategoryTypes(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -1736,7 +2251,9 @@ def getCategoryTypes(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
-def getTypes(request):
+def createTypesQuery(request, queryObject):
+	# Bygger upp query för getTypes utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
+
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -1749,7 +2266,7 @@ def getTypes(request):
 		return list(map(itemFormat, json['aggregations']['data']['buckets']))
 
 	query = {
-		'query': createQuery(request),
+		'query': queryObject,
 		'size': 0,
 		'aggs': {
 			'data': {
@@ -1764,10 +2281,136 @@ def getTypes(request):
 		}
 	}
 
+	return query, jsonFormat
+
+@response_cache.cachedResponse
+def getTypes(request):
+	query, jsonFormat = createTypesQuery(request, createQuery(request))
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+def useLocationLookup(aggs):
+	# Tar bort geohash_grid (location) från sub-aggregationer för socken (places.id) buckets när koordinaterna
+	# kan hämtas från gazetteer (se loadGazetteer) istället, geohash_grid med precision 12 är en av de dyraste sub-aggregationerna
+	if gazetteerIndex.get() is not None:
+		aggs.pop('location', None)
+
+	return aggs
+
+# Koordinater för socknar som saknades i gazetteer och har hämtats från ES (None om socken inte finns),
+# id: (tid, koordinater), så att samma socken bara hämtas från ES en gång per location_lookup_ttl sekunder
+missingLocations = {}
+
+def lookupLocations(ids):
+	# Levererar dict med koordinater för socken ids från gazetteer
+	gazetteer = gazetteerIndex.get()
+
+	locations = {}
+	missing = []
+
+	now = time.time()
+	ttl = getattr(es_config, 'location_lookup_ttl', 3600)
+
+	for sockenId in ids:
+		if gazetteer is not None and sockenId in gazetteer['ids']:
+			locations[sockenId] = gazetteer['socken'][gazetteer['ids'][sockenId]]['location']
+		elif sockenId in missingLocations and now-missingLocations[sockenId][0] < ttl:
+			locations[sockenId] = missingLocations[sockenId][1]
+		else:
+			missing.append(sockenId)
+
+	# Socknar som saknas i gazetteer (t.ex. nya sedan den laddades) hämtas från ES, location_lookup_max socknar per anrop,
+	# och gazetteer laddas om, högst en gång per location_lookup_refresh sekunder
+	if len(missing) > 0:
+		gazetteerIndex.refresh(getattr(es_config, 'location_lookup_refresh', 300))
+
+		chunkSize = getattr(es_config, 'location_lookup_max', 1000)
+
+		for chunkStart in range(0, len(missing), chunkSize):
+			chunk = missing[chunkStart:chunkStart+chunkSize]
+
+			query = {
+				'size': 0,
+				'aggs': {
+					'data': {
+						'nested': {
+							'path': 'places'
+						},
+						'aggs': {
+							'data': {
+								'filter': {
+									'terms': {
+										'places.id': chunk
+									}
+								},
+								'aggs': {
+									'data': {
+										'terms': {
+											'field': 'places.id',
+											'size': len(chunk)
+										},
+										'aggs': {
+											'location': {
+												'geohash_grid': {
+													'field': 'places.location',
+													'precision': 12
+												}
+											}
+										}
+									}
+								}
+							}
+						}
+					}
+				}
+			}
+
+			responseData = esQuery(None, query, None, None, True)
+
+			if 'aggregations' in responseData:
+				for bucket in resolveLocations(responseData['aggregations']['data']['data']['data']['buckets']):
+					locations[bucket['key']] = bucket['location_point']
+
+				for sockenId in chunk:
+					missingLocations[sockenId] = (now, locations.get(sockenId))
+
+	return locations
+
+def resolveLocations(buckets):
+	# Koordinater för alla socken buckets i ett anrop, läggs i bucket['location_point'] som läses av bucketLocation
+	# Buckets med location (geohash_grid) avkodas via geohash.decode_many, andra hämtas från gazetteer via lookupLocations
+	gridBuckets = [bucket for bucket in buckets if 'location' in bucket and len(bucket['location']['buckets']) > 0]
+	points = geohash.decode_many([bucket['location']['buckets'][0]['key'] for bucket in gridBuckets])
+
+	for bucket, point in zip(gridBuckets, points):
+		bucket['location_point'] = point
+
+	# Platser utan koordinater
+	for bucket in buckets:
+		if 'location' in bucket and len(bucket['location']['buckets']) == 0:
+			bucket['location_point'] = None
+
+	lookupBuckets = [bucket for bucket in buckets if not 'location' in bucket]
+
+	if len(lookupBuckets) > 0:
+		locations = lookupLocations([bucket['key'] for bucket in lookupBuckets])
+
+		for bucket in lookupBuckets:
+			bucket['location_point'] = locations[bucket['key']] if bucket['key'] in locations else None
+
+	return buckets
+
+def bucketLocation(bucket):
+	# Koordinater för socken bucket, från resolveLocations eller annars för bara denna bucket
+	if not 'location_point' in bucket:
+		resolveLocations([bucket])
+
+	return bucket['location_point']
+
+@snapshots.snapshotResponse('socken_total')
+@response_cache.cachedResponse
 def getSockenTotal(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -1778,103 +2421,74 @@ def getSockenTotal(request):
 			'landskap': item['landskap']['buckets'][0]['key'] if len(item['landskap']['buckets']) > 0 else None,
 			'lan': item['lan']['buckets'][0]['key'] if len(item['lan']['buckets']) > 0 else None,
 			'lm_id': item['lm_id']['buckets'][0]['key'] if len(item['lm_id']['buckets']) > 0 else '',
-			'location': geohash.decode(item['location']['buckets'][0]['key']),
+			'location': bucketLocation(item),
 			'doc_count': item['data']['buckets'][0]['doc_count']
 		}
 
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
-		return list(map(itemFormat, json['aggregations']['data']['data']['buckets']))
-
-	query = {
-		'size': 0,
-		'aggs': {
-			'data': {
-				'terms': {
-					'field': 'materialtype',
-					'size': 10000,
-					'order': {
-						'_term': 'asc'
-					}
-				}
-			}
-		}
-	}
-
-	response = {}
+		return list(map(itemFormat, resolveLocations(json['aggregations']['data']['data']['buckets'])))
 
-	typesResponse = esQuery(request, query, None, None, True)
-
-	for type in typesResponse['aggregations']['data']['buckets']:
-		query = {
-			'query': {
-				'query_string': {
-					'query': 'materialtype: '+type['key']
-				}
+	aggs = {
+		'data': {
+			'nested': {
+				'path': 'places'
 			},
-			'size': 0,
 			'aggs': {
 				'data': {
-					'nested': {
-						'path': 'places'
+					'terms': {
+						'field': 'places.id',
+						'size': 10000
 					},
 					'aggs': {
 						'data': {
 							'terms': {
-								'field': 'places.id',
-								'size': 10000
-							},
-							'aggs': {
-								'data': {
-									'terms': {
-										'field': 'places.name',
-										'size': 1,
-										'order': {
-											'_term': 'asc'
-										}
-									}
-								},
-								'harad': {
-									'terms': {
-										'field': 'places.harad',
-										'size': 1,
-										'order': {
-											'_term': 'asc'
-										}
-									}
-								},
-								'landskap': {
-									'terms': {
-										'field': 'places.landskap',
-										'size': 1,
-										'order': {
-											'_term': 'asc'
-										}
-									}
-								},
-								'lan': {
-									'terms': {
-										'field': 'places.county',
-										'size': 1,
-										'order': {
-											'_term': 'asc'
-										}
-									}
-								},
-								'location': {
-									'geohash_grid': {
-										'field': 'places.location',
-										'precision': 12
-									}
-								},
-								'lm_id': {
-									'terms': {
-										'field': 'places.lm_id',
-										'size': 1,
-										'order': {
-											'_term': 'asc'
-										}
-									}
+								'field': 'places.name',
+								'size': 1,
+								'order': {
+									'_term': 'asc'
+								}
+							}
+						},
+						'harad': {
+							'terms': {
+								'field': 'places.harad',
+								'size': 1,
+								'order': {
+									'_term': 'asc'
+								}
+							}
+						},
+						'landskap': {
+							'terms': {
+								'field': 'places.landskap',
+								'size': 1,
+								'order': {
+									'_term': 'asc'
+								}
+							}
+						},
+						'lan': {
+							'terms': {
+								'field': 'places.county',
+								'size': 1,
+								'order': {
+									'_term': 'asc'
+								}
+							}
+						},
+						'location': {
+							'geohash_grid': {
+								'field': 'places.location',
+								'precision': 12
+							}
+						},
+						'lm_id': {
+							'terms': {
+								'field': 'places.lm_id',
+								'size': 1,
+								'order': {
+									'_term': 'asc'
 								}
 							}
 						}
@@ -1882,66 +2496,132 @@ def getSockenTotal(request):
 				}
 			}
 		}
+	}
 
-		queryResponse = esQuery(request, query, jsonFormat, None, True)
+	useLocationLookup(aggs['data']['aggs']['data']['aggs'])
 
-		response[type['key']] = type['doc_count'] = queryResponse
+	# Anropar esQueryByType som hämtar aggregationen för alla materialtyper i ett anrop
+	return esQueryByType(request, aggs, jsonFormat)
 
+def createMarkMetadataAggregation(markMetadataFilter):
+	# Sub-aggregation för places buckets, räknar dokument i bucket som matchar markMetadataFilter (används för has_metadata flaggan)
+	return {
+		'reverse_nested': {},
+		'aggs': {
+			'data': {
+				'filter': markMetadataFilter
+			}
+		}
+	}
 
-	jsonResponse = JsonResponse(response)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
+def sockenItemFormat(item):
+	# Formaterar socken bucket (places.id) med sub-aggregationer från createSockenAggregations
+	ret = {
+		'id': item['key'],
+		'name': item['data']['buckets'][0]['key'],
+		'harad': item['harad']['buckets'][0]['key'] if len(item['harad']['buckets']) > 0 else None,
+		'landskap': item['landskap']['buckets'][0]['key'] if len(item['landskap']['buckets']) > 0 else None,
+		'lan': item['lan']['buckets'][0]['key'] if len(item['lan']['buckets']) > 0 else None,
+		'lm_id': item['lm_id']['buckets'][0]['key'] if len(item['lm_id']['buckets']) > 0 else '',
+		'location': bucketLocation(item),
+		'doc_count': item['parent_doc_count']['doc_count'],
+		'page_count': item['page_count']['pages']['value'],
+		'relation_type': [relation_type['key'] for relation_type in item['relation_type']['buckets'] if len(item['relation_type']['buckets']) > 0]
+	}
 
-	return jsonResponse
+	if 'has_metadata' in item:
+		ret['has_metadata'] = item['has_metadata']['data']['doc_count'] > 0
 
-def getSocken(request, sockenId = None):
-	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
-	def itemFormat(item):
-		return {
-			'id': item['key'],
-			'name': item['data']['buckets'][0]['key'],
-			'harad': item['harad']['buckets'][0]['key'] if len(item['harad']['buckets']) > 0 else None,
-			'landskap': item['landskap']['buckets'][0]['key'] if len(item['landskap']['buckets']) > 0 else None,
-			'lan': item['lan']['buckets'][0]['key'] if len(item['lan']['buckets']) > 0 else None,
-			'lm_id': item['lm_id']['buckets'][0]['key'] if len(item['lm_id']['buckets']) > 0 else '',
-			'location': geohash.decode(item['location']['buckets'][0]['key']),
-			'doc_count': item['parent_doc_count']['doc_count'],
-			'page_count': item['page_count']['pages']['value'],
-			'relation_type': [relation_type['key'] for relation_type in item['relation_type']['buckets'] if len(item['relation_type']['buckets']) > 0]
+	return ret
+
+def createSockenAggregations():
+	# Sub-aggregationer för varje socken (places.id) bucket, används av createSockenQuery och loadGazetteer
+	return {
+		'page_count': {
+			'reverse_nested': {},
+			'aggs': {
+				'pages': {
+					'sum': {
+						'field': 'archive.total_pages'
+					}
+				}
+			}
+		},
+		'data': {
+			'terms': {
+				'field': 'places.name',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'parent_doc_count': {
+			'reverse_nested': {}
+		},
+		'harad': {
+			'terms': {
+				'field': 'places.harad',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'landskap': {
+			'terms': {
+				'field': 'places.landskap',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'lan': {
+			'terms': {
+				'field': 'places.county',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'location': {
+			'geohash_grid': {
+				'field': 'places.location',
+				'precision': 12
+			}
+		},
+		'lm_id': {
+			'terms': {
+				'field': 'places.lm_id',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'relation_type': {
+			'terms': {
+				'field': 'places.type',
+				'size': 100,
+				'order': {
+					'_term': 'asc'
+				}
+			}
 		}
+	}
+
+def createSockenQuery(request, queryObject, sockenId = None):
+	# Bygger upp query för getSocken utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
 
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
 		if sockenId is not None:
-			socken = [item for item in map(itemFormat, json['aggregations']['data']['data']['buckets']) if item['id'] == sockenId]
+			socken = [item for item in map(sockenItemFormat, resolveLocations(json['aggregations']['data']['data']['buckets'])) if item['id'] == sockenId]
 			return socken[0]
 		else:
-			return list(map(itemFormat, json['aggregations']['data']['data']['buckets']))
-
-	if sockenId is not None:
-		queryObject = {
-			'bool': {
-				'must': [
-					{
-						'nested': {
-						'path': 'places',
-						'query': {
-							'bool': {
-								'should': [
-									{
-										'match': {
-											'places.id': sockenId
-										}
-									}
-								]
-							}
-						}
-					}
-				}
-			]
-		}
-	}
-	else:
-		queryObject = createQuery(request)
+			return list(map(sockenItemFormat, resolveLocations(json['aggregations']['data']['data']['buckets'])))
 
 	query = {
 		'query': queryObject,
@@ -1957,124 +2637,93 @@ def getSocken(request, sockenId = None):
 							'field': 'places.id',
 							'size': 10000
 						},
-						'aggs': {
-							'page_count': {
-								'reverse_nested': {},
-								'aggs': {
-									'pages': {
-										'sum': {
-											'field': 'archive.total_pages'
-										}
-									}
-								}
-							},
-							'data': {
-								'terms': {
-									'field': 'places.name',
-									'size': 1,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							},
-							'parent_doc_count': {
-								'reverse_nested': {}
-							},
-							'harad': {
-								'terms': {
-									'field': 'places.harad',
-									'size': 1,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							},
-							'landskap': {
-								'terms': {
-									'field': 'places.landskap',
-									'size': 1,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							},
-							'lan': {
-								'terms': {
-									'field': 'places.county',
-									'size': 1,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							},
-							'location': {
-								'geohash_grid': {
-									'field': 'places.location',
-									'precision': 12
-								}
-							},
-							'lm_id': {
-								'terms': {
-									'field': 'places.lm_id',
-									'size': 1,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							},
-							'relation_type': {
-								'terms': {
-									'field': 'places.type',
-									'size': 100,
-									'order': {
-										'_term': 'asc'
-									}
-								}
-							}
-						}
+						'aggs': useLocationLookup(createSockenAggregations())
 					}
 				}
 			}
 		}
 	}
 
-	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat, None, True)
-	logger.debug("url, query %s %s", request, query)
-
+	# Flagga på socken för snabb kartval och annan kart symbol (has_metadata), räknas ut i samma anrop via filter aggregation under varje socken
 	if ('mark_metadata' in request.GET):
-		if not 'bool' in query['query']:
-			query['query'] = {
-				'bool': {
-					'must': []
-				}
-			}
-		# Get data to calculate flag on socken for quick map selection and different map symbol, currently using  value 'has_metadata"
 		if request.GET['mark_metadata'] == 'transcriptionstatus':
-			query['query']['bool']['must'].append({
+			markMetadataFilter = {
 				'match': {
 					'transcriptionstatus': 'readytotranscribe'
 				}
-			})
+			}
 		else:
-			query['query']['bool']['must'].append({
+			markMetadataFilter = {
 				'match_phrase': {
 					'metadata.type': request.GET['mark_metadata']
 				}
-			})
-		metadataSockenResponse = esQuery(request, query, jsonFormat, None, True)
-		logger.debug("url, query %s %s", request, query)
+			}
 
-		sockenJson = esQueryResponse
+		query['aggs']['data']['aggs']['data']['aggs']['has_metadata'] = createMarkMetadataAggregation(markMetadataFilter)
 
-		for socken in sockenJson['data']:
-			socken['has_metadata'] = any(s['id'] == socken['id'] for s in metadataSockenResponse['data'])
+	return query, jsonFormat
 
-	jsonResponse = JsonResponse(esQueryResponse)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
+@response_cache.cachedResponse
+def getSocken(request, sockenId = None):
+	# Metadata för en socken från gazetteer (se loadGazetteer) om den har laddats, has_metadata (mark_metadata=) kräver ES
+	if sockenId is not None and not 'mark_metadata' in request.GET:
+		gazetteer = gazetteerIndex.get()
 
-	return jsonResponse
+		if gazetteer is not None and sockenId in gazetteer['ids']:
+			socken = gazetteer['socken'][gazetteer['ids'][sockenId]]
 
+			return localIndexResponse(request, socken, {}, socken['doc_count'])
+
+	if sockenId is not None:
+		queryObject = {
+			'bool': {
+				'must': [
+					{
+						'nested': {
+						'path': 'places',
+						'query': {
+							'bool': {
+								'should': [
+									{
+										'match': {
+											'places.id': sockenId
+										}
+									}
+								]
+							}
+						}
+					}
+				}
+			]
+		}
+	}
+	else:
+		queryObject = createQuery(request)
+
+	query, jsonFormat = createSockenQuery(request, queryObject, sockenId)
+
+	# stream=true, svaret skickas till klienten medan det parsas, se esStreamingQuery
+	if sockenId is None and isStreaming(request):
+		return esStreamingQuery(request, query, ['aggregations', 'data', 'data', 'buckets'], jsonFormat)
+
+	metadataFunc = None
+
+	# Paging via after=, se usePagedAggregation
+	if sockenId is None:
+		pagingError = pagingParamError(request)
+
+		if pagingError is not None:
+			return pagingError
+
+		jsonFormat, metadataFunc = usePagedAggregation(request, query, ['data', 'data'], jsonFormat)
+
+	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
+	esQueryResponse = esQuery(request, query, jsonFormat, metadataFunc=metadataFunc)
+	logger.debug("url, query %s %s", request, query)
+
+	return esQueryResponse
+
+@response_cache.cachedResponse
 def getLetters(request, sockenId = None):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -2085,24 +2734,41 @@ def getLetters(request, sockenId = None):
 			'landskap': item['landskap']['buckets'][0]['key'] if len(item['landskap']['buckets']) > 0 else None,
 			'lan': item['lan']['buckets'][0]['key'] if len(item['lan']['buckets']) > 0 else None,
 			'lm_id': item['lm_id']['buckets'][0]['key'] if len(item['lm_id']['buckets']) > 0 else '',
-			'location': geohash.decode(item['location']['buckets'][0]['key'])
+			'location': bucketLocation(item)
 		}
 
 		if 'destination_places' in item:
 			ret['destinations'] = subItemListFormat(item)
 
+		if 'has_metadata' in item:
+			ret['has_metadata'] = item['has_metadata']['data']['doc_count'] > 0
+
 		return ret
 
 	def subItemListFormat(subItem):
-		return [item for item in map(itemFormat, subItem['destination_places']['sub']['places']['places']['buckets'])]
+		return list(map(itemFormat, subItem['destination_places']['sub']['places']['places']['buckets']))
+
+	def resolveAllLocations(buckets):
+		# Koordinater för alla avsändnings- och destinationsorter i svaret i ett anrop till resolveLocations
+		allBuckets = []
+
+		for bucket in buckets:
+			allBuckets.append(bucket)
+
+			if 'destination_places' in bucket:
+				allBuckets.extend(bucket['destination_places']['sub']['places']['places']['buckets'])
+
+		resolveLocations(allBuckets)
+
+		return buckets
 
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
 		if sockenId is not None:
-			socken = [item for item in map(itemFormat, json['aggregations']['data']['data']['buckets']) if item['id'] == sockenId]
+			socken = [item for item in map(itemFormat, resolveAllLocations(json['aggregations']['data']['data']['buckets'])) if item['id'] == sockenId]
 			return socken[0]
 		else:
-			return list(map(itemFormat, json['aggregations']['letters']['dispatch_places']['places']['buckets']))
+			return list(map(itemFormat, resolveAllLocations(json['aggregations']['letters']['dispatch_places']['places']['buckets'])))
 
 	if sockenId is not None:
 		queryObject = {
@@ -2292,35 +2958,90 @@ def getLetters(request, sockenId = None):
 		}
 	}
 
-	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat, None, True)
-
+	# Flagga på avsändarort (has_metadata), räknas ut i samma anrop via filter aggregation under varje socken
 	if ('mark_metadata' in request.GET):
-		if not 'bool' in query['query']:
-			query['query'] = {
-				'bool': {
-					'must': []
-				}
-			}
-		query['query']['bool']['must'].append({
+		query['aggs']['letters']['aggs']['dispatch_places']['aggs']['places']['aggs']['has_metadata'] = createMarkMetadataAggregation({
 			'match_phrase': {
 				'metadata.type': request.GET['mark_metadata']
 			}
 		})
-		metadataSockenResponse = esQuery(request, query, jsonFormat, None, True)
 
-		sockenJson = esQueryResponse
+	dispatchPlacesAggs = query['aggs']['letters']['aggs']['dispatch_places']['aggs']['places']['aggs']
+	useLocationLookup(dispatchPlacesAggs)
+	useLocationLookup(dispatchPlacesAggs['destination_places']['aggs']['sub']['aggs']['places']['aggs']['places']['aggs'])
 
-		for socken in sockenJson['data']:
-			socken['has_metadata'] = any(s['id'] == socken['id'] for s in metadataSockenResponse['data'])
+	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
+	esQueryResponse = esQuery(request, query, jsonFormat)
+	return esQueryResponse
 
-	jsonResponse = JsonResponse(esQueryResponse)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
 
-	return jsonResponse
+def loadGazetteer():
+	# Hämtar alla socknar från ES (composite aggregation, sida för sida) och bygger upp gazetteer
+	# för autocomplete/socken/ och get_socken/[id]/, socken metadata ändras sällan
+	query = {
+		'size': 0,
+		'aggs': {
+			'data': {
+				'nested': {
+					'path': 'places'
+				},
+				'aggs': {
+					'data': createCompositeAggregation('places.id', createSockenAggregations(), getattr(es_config, 'composite_page_size', 1000))
+				}
+			}
+		}
+	}
+
+	socken = []
+	placeCounts = []
+
+	for bucket in esCompositeBuckets(None, query, ['data', 'data']):
+		if len(bucket['data']['buckets']) == 0 or len(bucket['location']['buckets']) == 0:
+			continue
+
+		socken.append(sockenItemFormat(bucket))
+		# Antal platser (nested places) med sockens namn, doc_count i autocomplete/socken/
+		placeCounts.append(bucket['data']['buckets'][0]['doc_count'])
+
+	return {
+		'socken': socken,
+		'placeCounts': placeCounts,
+		'ids': dict((item['id'], position) for position, item in enumerate(socken)),
+		'names': local_index.SubstringIndex([item['name'] for item in socken])
+	}
 
+gazetteerIndex = local_index.LocalIndex('gazetteer', loadGazetteer)
 
+@response_cache.cachedResponse
 def getSockenAutocomplete(request):
+	# Socknar vars namn innehåller söksträngen, från gazetteer (se loadGazetteer) om den har laddats, annars från ES
+	gazetteer = gazetteerIndex.get()
+
+	if gazetteer is not None:
+		timings = {}
+
+		with metrics.timer(timings, 'local_lookup'):
+			data = []
+
+			for position in gazetteer['names'].search(request.GET['search']):
+				socken = gazetteer['socken'][position]
+
+				data.append({
+					'id': socken['id'],
+					'name': socken['name'],
+					'harad': socken['harad'],
+					'landskap': socken['landskap'],
+					'lan': socken['lan'],
+					'lm_id': socken['lm_id'],
+					'location': socken['location'],
+					'doc_count': gazetteer['placeCounts'][position]
+				})
+
+			# Samma ordning som terms aggregation i ES, flest dokument först
+			data.sort(key=lambda socken: (-socken['doc_count'], socken['id']))
+
+		return localIndexResponse(request, data, timings)
+
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -2330,13 +3051,13 @@ def getSockenAutocomplete(request):
 			'landskap': item['landskap']['buckets'][0]['key'],
 			'lan': item['lan']['buckets'][0]['key'],
 			'lm_id': item['lm_id']['buckets'][0]['key'] if len(item['lm_id']['buckets']) > 0 else '',
-			'location': geohash.decode(item['location']['buckets'][0]['key']),
+			'location': bucketLocation(item),
 			'doc_count': item['data']['buckets'][0]['doc_count']
 		}
 
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
-		return list(map(itemFormat, json['aggregations']['data']['data']['data']['buckets']))
+		return list(map(itemFormat, resolveLocations(json['aggregations']['data']['data']['data']['buckets'])))
 
 	query = {
 		'size': 0,
@@ -2350,11 +3071,7 @@ def getSockenAutocomplete(request):
 						'filter': {
 							'bool': {
 								'must': [
-									{
-										'regexp': {
-											'places.name': '(.+?)'+request.GET['search']+'(.+?)'
-										}
-									}
+									substringQuery('places.name', request.GET['search'])
 								]
 							}
 						},
@@ -2430,6 +3147,7 @@ def getSockenAutocomplete(request):
 	return esQueryResponse
 
 
+@response_cache.cachedResponse
 def getHarad(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -2497,10 +3215,19 @@ def getHarad(request):
 		}
 	}
 
+	# Paging via after=, se usePagedAggregation
+	pagingError = pagingParamError(request)
+
+	if pagingError is not None:
+		return pagingError
+
+	jsonFormat, metadataFunc = usePagedAggregation(request, query, ['data', 'data'], jsonFormat)
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat)
+	esQueryResponse = esQuery(request, query, jsonFormat, metadataFunc=metadataFunc)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getLandskap(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -2537,6 +3264,7 @@ def getLandskap(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getCounty(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -2573,6 +3301,7 @@ def getCounty(request):
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
 
+@response_cache.cachedResponse
 def getPersons(request, personId = None):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -2696,8 +3425,23 @@ def getPersons(request, personId = None):
 		}
 	}
 
+	# stream=true, svaret skickas till klienten medan det parsas, se esStreamingQuery
+	if personId is None and isStreaming(request):
+		return esStreamingQuery(request, query, ['aggregations', 'data', 'data', 'buckets'], jsonFormat)
+
+	metadataFunc = None
+
+	# Paging via after=, se usePagedAggregation
+	if personId is None:
+		pagingError = pagingParamError(request)
+
+		if pagingError is not None:
+			return pagingError
+
+		jsonFormat, metadataFunc = usePagedAggregation(request, query, ['data', 'data'], jsonFormat)
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat)
+	esQueryResponse = esQuery(request, query, jsonFormat, metadataFunc=metadataFunc)
 	return esQueryResponse
 
 
@@ -2716,29 +3460,182 @@ def _getPerson(request, personId):
 	esQueryResponse = esQuery(request, query)
 	return esQueryResponse
 
-def getPersonsAutocomplete(request):
-	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
-	def itemFormat(item):
-		retObj = {
-			'id': item['key'],
-			'name': item['data']['buckets'][0]['key'],
-			'doc_count': item['doc_count']
+def personItemFormat(item):
+	# Formaterar person bucket (persons.id) med sub-aggregationer från createPersonAggregations
+	retObj = {
+		'id': item['key'],
+		'name': item['data']['buckets'][0]['key'],
+		'doc_count': item['doc_count']
+	}
+
+	if (len(item['birth_year']['buckets']) > 0):
+		retObj['birth_year'] = item['birth_year']['buckets'][0]['key_as_string'].split('-')[0]
+
+	if len(item['home']['buckets']) > 0:
+		retObj['home'] = {
+			'id': item['home']['buckets'][0]['key'],
+			'name': item['home']['buckets'][0]['data']['buckets'][0]['key']
 		}
 
-		if (len(item['birth_year']['buckets']) > 0):
-			retObj['birth_year'] = item['birth_year']['buckets'][0]['key_as_string'].split('-')[0]
+	return retObj
+
+def createPersonAggregations():
+	# Sub-aggregationer för varje person (persons.id) bucket, namn, födelseår, relation och hemort
+	return {
+		'data': {
+			'terms': {
+				'field': 'persons.name.raw',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'birth_year': {
+			'terms': {
+				'field': 'persons.birth_year',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'relation': {
+			'terms': {
+				'field': 'persons.relation',
+				'size': 1,
+				'order': {
+					'_term': 'asc'
+				}
+			}
+		},
+		'home': {
+			'terms': {
+				'field': 'persons.home.id',
+				'size': 10,
+				'order': {
+					'_term': 'asc'
+				}
+			},
+			'aggs': {
+				'data': {
+					'terms': {
+						'field': 'persons.home.name',
+						'size': 10,
+						'order': {
+							'_term': 'asc'
+						}
+					}
+				}
+			}
+		}
+	}
 
-		if len(item['home']['buckets']) > 0:
-			retObj['home'] = {
-				'id': item['home']['buckets'][0]['key'],
-				'name': item['home']['buckets'][0]['data']['buckets'][0]['key']
+def loadPersonsIndex():
+	# Hämtar alla personer från ES (composite aggregation, sida för sida) och bygger upp lokalt index för autocomplete/persons/
+	aggs = createPersonAggregations()
+
+	# Antal dokument per relation (i, c, ...) för relation= param
+	aggs['relations'] = {
+		'terms': {
+			'field': 'persons.relation',
+			'size': 50
+		}
+	}
+
+	query = {
+		'size': 0,
+		'aggs': {
+			'data': {
+				'nested': {
+					'path': 'persons'
+				},
+				'aggs': {
+					'data': createCompositeAggregation('persons.id', aggs, getattr(es_config, 'composite_page_size', 1000))
+				}
 			}
+		}
+	}
+
+	persons = []
+	relations = []
+
+	for bucket in esCompositeBuckets(None, query, ['data', 'data']):
+		if len(bucket['data']['buckets']) == 0:
+			continue
+
+		persons.append(personItemFormat(bucket))
+		relations.append(dict((relation['key'], relation['doc_count']) for relation in bucket['relations']['buckets']))
+
+	return {
+		'persons': persons,
+		'relations': relations,
+		'names': local_index.SubstringIndex([person['name'] for person in persons])
+	}
+
+personsIndex = local_index.LocalIndex('persons', loadPersonsIndex)
+
+def localIndexResponse(request, data, timings, total = None):
+	# Svar från lokalt index, samma form som svar från esQuery
+	outputData = {
+		'data': data,
+		'metadata': {
+			'total': total if total is not None else len(data),
+			'took': 0
+		}
+	}
+
+	with metrics.timer(timings, 'encode'):
+		jsonResponse = JsonResponse(outputData)
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	metrics.emit(request, timings)
+
+	return jsonResponse
+
+def wildcardValue(value):
+	# Escapar tecken som har betydelse i wildcard query (* ? \)
+	return re.sub(r'([*?\\])', r'\\\1', value)
+
+def substringQuery(field, value):
+	# Samma matchning som lokala index (local_index.SubstringIndex.search), används när indexet inte har laddats än:
+	# utan hänsyn till versaler och mellanslag normaliserade, value kan finnas var som helst i fältet (även i början)
+	return {
+		'wildcard': {
+			field: {
+				'value': '*'+wildcardValue(local_index.normalize(value))+'*',
+				'case_insensitive': True
+			}
+		}
+	}
+
+@response_cache.cachedResponse
+def getPersonsAutocomplete(request):
+	# Personer vars namn innehåller söksträngen, från lokalt index (se loadPersonsIndex) om det har laddats, annars från ES
+	index = personsIndex.get()
+
+	if index is not None:
+		timings = {}
+
+		with metrics.timer(timings, 'local_lookup'):
+			relation = request.GET['relation'] if 'relation' in request.GET else None
+
+			data = []
+
+			for position in index['names'].search(request.GET['search']):
+				docCount = index['relations'][position].get(relation, 0) if relation else index['persons'][position]['doc_count']
+
+				if docCount > 0:
+					data.append(dict(index['persons'][position], doc_count=docCount))
+
+			# Samma ordning som terms aggregation i ES, flest dokument först
+			data.sort(key=lambda person: (-person['doc_count'], person['id']))
 
-		return retObj
+		return localIndexResponse(request, data[:int(request.GET['count']) if 'count' in request.GET else 10000], timings)
 
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
-		return list(map(itemFormat, json['aggregations']['data']['data']['data']['buckets']))
+		return list(map(personItemFormat, json['aggregations']['data']['data']['data']['buckets']))
 
 	query = {
 		'size': 0,
@@ -2752,11 +3649,7 @@ def getPersonsAutocomplete(request):
 						'filter': {
 							'bool': {
 								'must': [
-									{
-										'regexp': {
-											'persons.name.raw': '(.+?)'+request.GET['search']+'(.+?)'
-										}
-									}
+									substringQuery('persons.name.raw', request.GET['search'])
 								]
 							}
 						},
@@ -2767,55 +3660,7 @@ def getPersonsAutocomplete(request):
 									'field': 'persons.id',
 									'size': request.GET['count'] if 'count' in request.GET else 10000
 								},
-								'aggs': {
-									'data': {
-										'terms': {
-											'field': 'persons.name.raw',
-											'size': 1,
-											'order': {
-												'_term': 'asc'
-											}
-										}
-									},
-									'birth_year': {
-										'terms': {
-											'field': 'persons.birth_year',
-											'size': 1,
-											'order': {
-												'_term': 'asc'
-											}
-										}
-									},
-									'relation': {
-										'terms': {
-											'field': 'persons.relation',
-											'size': 1,
-											'order': {
-												'_term': 'asc'
-											}
-										}
-									},
-									'home': {
-										'terms': {
-											'field': 'persons.home.id',
-											'size': 10,
-											'order': {
-												'_term': 'asc'
-											}
-										},
-										'aggs': {
-											'data': {
-												'terms': {
-													'field': 'persons.home.name',
-													'size': 10,
-													'order': {
-														'_term': 'asc'
-													}
-												}
-											}
-										}
-									}
-								}
+								'aggs': createPersonAggregations()
 
 							}
 						}
@@ -2946,27 +3791,47 @@ def getRelatedPersons(request, relation):
 	return esQueryResponse
 
 
+@response_cache.cachedResponse
 def getInformants(request):
 	return getRelatedPersons(request, 'i')
 
 
+@response_cache.cachedResponse
 def getCollectors(request):
 	return getRelatedPersons(request, 'c')
 
-def getPersonRoles(request):
-	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
-	def itemFormat(item):
-		return item['key']
+def loadDimensionCatalog():
+	# Hämtar alla värden för dimensioner som bara ändras när indexet byggs om, i ett anrop till ES (se dimension_catalog.py)
+	def bucketKeys(aggregation):
+		return [bucket['key'] for bucket in aggregation['buckets'] if bucket['key']]
+
+	def categoryFormat(item):
+		retObj = {
+			'key': item['key']
+		}
+
+		if len(item['data']['buckets']) > 0:
+			retObj['name'] = item['data']['buckets'][0]['key']
+
+			if len(item['data']['buckets'][0]['data']['buckets']) > 0:
+				retObj['type'] = item['data']['buckets'][0]['data']['buckets'][0]['key']
+
+		return retObj
 
-	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
-		return list(map(itemFormat, json['aggregations']['data']['data']['buckets']))
+		return {
+			'roles': bucketKeys(json['aggregations']['roles']['data']),
+			'types': bucketKeys(json['aggregations']['types']),
+			'categories': list(map(categoryFormat, json['aggregations']['categories']['buckets'])),
+			'category_types': bucketKeys(json['aggregations']['category_types']),
+			'landskap': bucketKeys(json['aggregations']['places']['landskap']),
+			'lan': bucketKeys(json['aggregations']['places']['lan'])
+		}
 
-	roleQuery = {
-		'query': createQuery(request) if request is not None else {},
+	query = {
 		'size': 0,
 		'aggs': {
-			'data': {
+			'roles': {
 				'nested': {
 					'path': 'persons'
 				},
@@ -2978,14 +3843,102 @@ def getPersonRoles(request):
 						}
 					}
 				}
+			},
+			'types': {
+				'terms': {
+					'field': 'materialtype',
+					'size': 10000,
+					'order': {
+						'_term': 'asc'
+					}
+				}
+			},
+			'categories': {
+				'terms': {
+					'field': 'taxonomy.category',
+					'size': 10000,
+					'order': {
+						'_term': 'asc'
+					}
+				},
+				'aggs': {
+					'data': {
+						'terms': {
+							'field': 'taxonomy.name',
+							'size': 10000
+						},
+						'aggs': {
+							'data': {
+								'terms': {
+									'field': 'taxonomy.type'
+								}
+							}
+						}
+					}
+				}
+			},
+			'category_types': {
+				'terms': {
+					'field': 'taxonomy.type',
+					'size': 10000,
+					'order': {
+						'_term': 'asc'
+					}
+				}
+			},
+			'places': {
+				'nested': {
+					'path': 'places'
+				},
+				'aggs': {
+					'landskap': {
+						'terms': {
+							'field': 'places.landskap',
+							'size': 10000,
+							'order': {
+								'_term': 'asc'
+							}
+						}
+					},
+					'lan': {
+						'terms': {
+							'field': 'places.county',
+							'size': 10000,
+							'order': {
+								'_term': 'asc'
+							}
+						}
+					}
+				}
 			}
 		}
 	}
 
-	roles = esQuery(request, roleQuery, jsonFormat, None, True)
+	return esQuery(None, query, jsonFormat, None, True)['data']
+
+dimensionCatalog = dimension_catalog.DimensionCatalog(loadDimensionCatalog)
+
+# Katalogen laddas om när indexet har ändrats (se index_generation.py)
+index_generation.onChange(dimensionCatalog.invalidate)
 
-	return list(filter(None, roles['data']))
+def getPersonRoles():
+	# Alla person roller (relation) i indexet, från dimension katalogen
+	return dimensionCatalog.get()['roles']
 
+def hasRoleAggregation(json, agg):
+	# Roll aggregationer (filter under nested persons) utan träffar tas bort ur svaret, så att bara roller som finns
+	# bland träffarna levereras (samma svar som när rollerna hämtades med samma query)
+	return agg == 'all' or not 'doc_count' in json['aggregations'][agg]['data'] or json['aggregations'][agg]['data']['doc_count'] > 0
+
+def getDimensions(request):
+	# Dimension katalogen: person roller, materialtyper, kategorier, kategori typer, landskap och län
+	jsonResponse = JsonResponse(dimensionCatalog.get())
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	return jsonResponse
+
+@snapshots.snapshotResponse('gender_total')
+@response_cache.cachedResponse
 def getGenderTotal(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
@@ -3007,21 +3960,6 @@ def getGenderTotal(request):
 
 		return ret
 
-	query = {
-		'size': 0,
-		'aggs': {
-			'data': {
-				'terms': {
-					'field': 'materialtype',
-					'size': 10000,
-					'order': {
-						'_term': 'asc'
-					}
-				}
-			}
-		}
-	}
-
 	def createAggregations(roles):
 		aggs = {
 			'all': {
@@ -3085,34 +4023,14 @@ def getGenderTotal(request):
 
 		return aggs
 
-	roles = getPersonRoles(None)
-
-	response = {}
-
-	typesResponse = esQuery(request, query, None, None, True)
-
-	for type in typesResponse['aggregations']['data']['buckets']:
-		query = {
-			'query': {
-				'query_string': {
-					'query': 'materialtype: '+type['key']
-				}
-			},
-			'size': 0,
-			'aggs': createAggregations(roles)
-		}
-
-		queryResponse = esQuery(request, query, jsonFormat, None, True)
-
-		response[type['key']] = type['doc_count'] = queryResponse
-
+	roles = getPersonRoles()
 
-	jsonResponse = JsonResponse(response)
-	jsonResponse['Access-Control-Allow-Origin'] = '*'
+	# Anropar esQueryByType som hämtar aggregationen för alla materialtyper i ett anrop
+	return esQueryByType(request, createAggregations(roles), jsonFormat)
 
-	return jsonResponse
+def createGenderQuery(request, queryObject):
+	# Bygger upp query för getGender utan att anropa ES, levererar query och jsonFormat (används även av getBatch)
 
-def getGender(request):
 	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
 	def itemFormat(item):
 		return {
@@ -3126,6 +4044,9 @@ def getGender(request):
 		ret = {}
 
 		for agg in json['aggregations']:
+			if not hasRoleAggregation(json, agg):
+				continue
+
 			if 'buckets' in json['aggregations'][agg]['data']:
 				ret[agg] = list(map(itemFormat, json['aggregations'][agg]['data']['buckets']))
 			elif 'buckets' in json['aggregations'][agg]['data']['data']:
@@ -3196,14 +4117,20 @@ def getGender(request):
 
 		return aggs
 
-	roles = getPersonRoles(request)
+	roles = getPersonRoles()
 
 	query = {
-		'query': createQuery(request),
+		'query': queryObject,
 		'size': 0,
 		'aggs': createAggregations(roles)
 	}
 
+	return query, jsonFormat
+
+@response_cache.cachedResponse
+def getGender(request):
+	query, jsonFormat = createGenderQuery(request, createQuery(request))
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat)
 	return esQueryResponse
@@ -3245,31 +4172,37 @@ def getSimilar(request, documentId):
 	return esQueryResponse
 
 
-def getDocuments(request):
-	# itemFormat som säger till hur varje object i esQuery resultatet skulle formateras
-	def itemFormat(item):
-		if '_source' in item:
-			returnItem = dict(item)
-			returnItem['_source'] = {}
+def createSourceFilter(request, includes = None):
+	# Bygger upp _source filter så att ES bara skickar de fält som behövs
+	# topics fälten (stora nested listor) skickas aldrig i listor av dokument
 
-			for key in item['_source']:
-				if not 'topics' in key:
-					#item['_source'].pop(key)
-					returnItem['_source'][key] = item['_source'][key]
+	# fields=[fält]: levererar bara angivna fält i _source (en eller flera). Exempel: `fields=title,year,places`
+	if ('fields' in request.GET):
+		includes = request.GET['fields'].split(',')
 
-			return returnItem
-		else:
-			return item
+	sourceFilter = {
+		'excludes': [
+			'*topics*'
+		]
+	}
 
+	if includes:
+		sourceFilter['includes'] = includes
+
+	return sourceFilter
+
+def getDocuments(request):
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
+	# topics fält har redan tagits bort av ES via _source filter
 	def jsonFormat(json):
-		return list(map(itemFormat, json['hits']['hits']))
+		return json['hits']['hits']
 
 	textField = 'text.raw' if 'search_raw' in request.GET and request.GET['search_raw'] != 'false' else 'text'
 	query = {
 		'query': createQuery(request),
 		'size': request.GET['size'] if 'size' in request.GET else 100,
 		'from': request.GET['from'] if 'from' in request.GET else 0,
+		'_source': createSourceFilter(request),
 		'highlight' : {
 			'pre_tags': [
 				'<span class="highlight">'
@@ -3312,11 +4245,138 @@ def getDocuments(request):
 
 		query['sort'] = sort
 
+	# stream=true, svaret skickas till klienten medan det parsas, se esStreamingQuery
+	if isStreaming(request):
+		return esStreamingQuery(request, query, ['hits', 'hits'], jsonFormat)
+
+	# Paging via cursor=, se useCursor
+	pagingError = pagingParamError(request)
+
+	if pagingError is not None:
+		return pagingError
+
+	metadataFunc = useCursor(request, query)
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat)
+	esQueryResponse = esQuery(request, query, jsonFormat, metadataFunc=metadataFunc)
 	return esQueryResponse
 
 
+def getDocumentsExport(request):
+	# Exporterar alla dokument som matchar params (samma params som documents/) som NDJSON, ett dokument per rad
+	# Använder point in time och search_after istället för from/size, varje batch kostar lika mycket oavsett hur långt in i resultatet den ligger
+	# batch_size=[antal]: antal dokument som hämtas från ES per anrop (default es_config.export_batch_size eller 1000, max 10000)
+	# fields=[fält]: bara angivna fält levereras i _source, se createSourceFilter
+	batchSize = getattr(es_config, 'export_batch_size', 1000)
+
+	if 'batch_size' in request.GET:
+		if not request.GET['batch_size'].isdigit() or int(request.GET['batch_size']) < 1:
+			return errorResponse('batch_size must be a positive integer')
+
+		batchSize = int(request.GET['batch_size'])
+
+	batchSize = min(batchSize, 10000)
+	keepAlive = getattr(es_config, 'export_keep_alive', '1m')
+
+	headers = {'Accept': 'application/json', 'content-type': 'application/json'}
+
+	timings = {}
+
+	# Öppnar point in time, alla batchar läses från samma version av indexet
+	with metrics.timer(timings, 'es_request'):
+		pitResponse = es_transport.esRequest('POST', '/'+es_config.index_name+'/_pit?keep_alive='+keepAlive, headers=headers)
+
+	if pitResponse.status_code != 200:
+		httpResponse = HttpResponse(pitResponse.content, status=pitResponse.status_code, content_type='application/json')
+		httpResponse['Access-Control-Allow-Origin'] = '*'
+
+		return httpResponse
+
+	pitId = json_backend.loads(pitResponse.content)['id']
+
+	query = {
+		'query': createQuery(request),
+		'size': batchSize,
+		'_source': createSourceFilter(request),
+		'track_total_hits': False,
+		# _shard_doc är den billigaste stabila sorteringen med point in time
+		'sort': [
+			{
+				'_shard_doc': 'asc'
+			}
+		]
+	}
+
+	# Remove queryObject if it is empty (Elasticsearch 7 seems to not like empty query object)
+	if not query['query']:
+		query.pop('query', None)
+
+	def exportContent():
+		currentPitId = pitId
+
+		try:
+			while True:
+				query['pit'] = {
+					'id': currentPitId,
+					'keep_alive': keepAlive
+				}
+
+				with metrics.timer(timings, 'es_request'):
+					esResponse = es_transport.esGet('/_search',
+													data=json_backend.dumps(query),
+													headers=headers)
+
+				with metrics.timer(timings, 'decode'):
+					responseData = json_backend.loads(esResponse.content)
+
+				# Fel från ES (t.ex. point in time som har gått ut eller shards som har misslyckats) avslutar exporten med en
+				# rad med error, så att klienten kan skilja en avbruten export från en komplett
+				if esResponse.status_code != 200 or 'error' in responseData or responseData.get('timed_out') or responseData.get('_shards', {}).get('failed', 0) > 0:
+					yield json_backend.dumps({
+						'error': responseData['error'] if 'error' in responseData else {
+							'status': esResponse.status_code,
+							'timed_out': responseData.get('timed_out', False),
+							'failures': responseData.get('_shards', {}).get('failures', [])
+						}
+					})+b'\n'
+
+					break
+
+				hits = responseData['hits']['hits']
+
+				if len(hits) == 0:
+					break
+
+				with metrics.timer(timings, 'encode'):
+					lines = []
+
+					for hit in hits:
+						lines.append(json_backend.dumps({
+							'_id': hit['_id'],
+							'_source': hit['_source'] if '_source' in hit else {}
+						}))
+
+				yield b'\n'.join(lines)+b'\n'
+
+				if len(hits) < batchSize:
+					break
+
+				# ES kan leverera ett nytt id för point in time
+				currentPitId = responseData['pit_id'] if 'pit_id' in responseData else currentPitId
+				query['search_after'] = hits[-1]['sort']
+		finally:
+			es_transport.esRequest('DELETE', '/_pit', data=json_backend.dumps({
+				'id': currentPitId
+			}), headers=headers)
+
+			metrics.emit(request, timings)
+
+	streamingResponse = StreamingHttpResponse(exportContent(), content_type='application/x-ndjson')
+	streamingResponse['Access-Control-Allow-Origin'] = '*'
+
+	return streamingResponse
+
+
 def getTexts(request):
 	# jsonFormat, säger till hur esQuery resultatet skulle formateras och vilkan del skulle användas (hits eller aggregation buckets)
 	def jsonFormat(json):
@@ -3367,6 +4427,14 @@ def getTexts(request):
 		'query': createQuery(request),
 		'size': request.GET['size'] if 'size' in request.GET else 100,
 		'from': request.GET['from'] if 'from' in request.GET else 0,
+		'_source': [
+			'title',
+			'materialtype',
+			'taxonomy',
+			'archive',
+			'year',
+			'source'
+		],
 		'highlight' : {
 			'pre_tags': [
 				'</td><td class="highlight-cell"><span class="highlight">'
@@ -3390,8 +4458,16 @@ def getTexts(request):
 
 		query['sort'] = sort
 
+	# Paging via cursor=, se useCursor
+	pagingError = pagingParamError(request)
+
+	if pagingError is not None:
+		return pagingError
+
+	metadataFunc = useCursor(request, query)
+
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
-	esQueryResponse = esQuery(request, query, jsonFormat)
+	esQueryResponse = esQuery(request, query, jsonFormat, metadataFunc=metadataFunc)
 
 	return esQueryResponse
 
@@ -3491,3 +4567,62 @@ def getPersonsGraph(request):
 	# Anropar esQuery, skickar query objekt och eventuellt jsonFormat funktion som formaterar resultat datat
 	esQueryResponse = esQuery(request, query, jsonFormat, '/_xpack/_graph/_explore')
 	return esQueryResponse
+
+
+def getMetrics(request):
+	# Tidsmätning av esQuery per view och fas i Prometheus text format, se metrics.py
+	return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def getCacheStats(request):
+	# Statistik för response cachen (träffar, missar, storlek i bytes)
+	jsonResponse = JsonResponse(response_cache.getStats())
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	return jsonResponse
+
+
+# Endpoints som kan hämtas via batch/, namn och function som bygger upp query och jsonFormat
+batchEndpoints = {
+	'types': createTypesQuery,
+	'categories': createCategoriesQuery,
+	'collection_years': createCollectionYearsQuery,
+	'birth_years': createBirthYearsQuery,
+	'gender': createGenderQuery,
+	'socken': createSockenQuery
+}
+
+@response_cache.cachedResponse
+def getBatch(request):
+	# Hämtar flera endpoints med samma params i ett anrop till ES (_msearch)
+	# endpoints=[endpoints]: vilka endpoints ska hämtas. Exempel: `endpoints=types,categories,socken&type=arkiv`
+	# Levererar svaret för varje endpoint under endpoint namnet: { types: { data, metadata }, categories: { data, metadata }, ... }
+	endpoints = request.GET['endpoints'].split(',') if 'endpoints' in request.GET else []
+
+	unknownEndpoints = [endpoint for endpoint in endpoints if endpoint not in batchEndpoints]
+
+	if len(endpoints) == 0 or len(unknownEndpoints) > 0:
+		jsonResponse = JsonResponse({
+			'error': 'Unknown or missing endpoints: '+','.join(unknownEndpoints),
+			'endpoints': sorted(batchEndpoints.keys())
+		}, status=400)
+		jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+		return jsonResponse
+
+	# createQuery körs bara en gång, alla endpoints använder samma query object
+	queryObject = createQuery(request)
+
+	queries = [batchEndpoints[endpoint](request, queryObject) for endpoint in endpoints]
+
+	response = dict(zip(endpoints, esMultiQuery(request, queries)))
+
+	jsonResponse = JsonResponse(response)
+	jsonResponse['Access-Control-Allow-Origin'] = '*'
+
+	# Svar där ES har levererat fel för någon endpoint cachas inte (se response_cache.esSucceeded)
+	errors = [response[endpoint] for endpoint in endpoints if 'error' in response[endpoint]]
+
+	if len(errors) > 0:
+		jsonResponse.esStatusCode = errors[0]['status']
+
+	return jsonResponse